@@ -1,19 +1,52 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from datetime import timedelta
 import os
 
 db = SQLAlchemy()
 login_manager = LoginManager()
 
-def create_app():
+def create_app(config=None):
+    from app.database import database_config, init_database
+    
     app = Flask(__name__)
     
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///ecommerce.db'
+    app.config.update(database_config())
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['CATALOG_CACHE_TTL'] = int(os.environ.get('CATALOG_CACHE_TTL', 300))
+    app.config['STOCK_RESERVATION_TTL'] = timedelta(minutes=int(os.environ.get('STOCK_RESERVATION_TTL_MINUTES', 60)))
+    app.config['RESERVATION_SWEEP_INTERVAL'] = int(os.environ.get('RESERVATION_SWEEP_INTERVAL', 60))
+    app.config['RESERVATION_SWEEP_BATCH'] = int(os.environ.get('RESERVATION_SWEEP_BATCH', 200))
+    app.config['PAGE_CACHE_BACKEND'] = os.environ.get('PAGE_CACHE_BACKEND', 'memory')
+    app.config['PAGE_CACHE_DIR'] = os.environ.get('PAGE_CACHE_DIR')
+    app.config['PAGE_CACHE_MAX_BYTES'] = int(os.environ.get('PAGE_CACHE_MAX_MB', 32)) * 1024 * 1024
+    app.config['PAGE_CACHE_TTL'] = int(os.environ.get('PAGE_CACHE_TTL', 60))
+    app.config['STATIC_FINGERPRINT'] = os.environ.get('STATIC_FINGERPRINT', '1') == '1'
+    app.config['STATIC_BUILD_DIR'] = os.environ.get('STATIC_BUILD_DIR')
+    app.config['IMAGE_WORKERS'] = int(os.environ.get('IMAGE_WORKERS', 2))
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 0)) or None
+    app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get('PASSWORD_HASH_QUEUE', 16))
+    app.config['PASSWORD_HASH_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+    app.config['MAINTENANCE_INTERVAL'] = int(os.environ.get('MAINTENANCE_INTERVAL', 60))
+    app.config['MAINTENANCE_BATCH'] = int(os.environ.get('MAINTENANCE_BATCH', 500))
+    app.config['CART_TTL_DAYS'] = int(os.environ.get('CART_TTL_DAYS', 60))
+    app.config['ORDER_ARCHIVE_DAYS'] = int(os.environ.get('ORDER_ARCHIVE_DAYS', 90))
+    app.config['PAYMENT_PREFERENCE_TTL'] = timedelta(minutes=int(os.environ.get('PAYMENT_PREFERENCE_TTL_MINUTES', 360)))
+    app.config['PAYMENT_WORKER_INTERVAL'] = float(os.environ.get('PAYMENT_WORKER_INTERVAL', 2))
+    app.config['PAYMENT_WORKERS'] = int(os.environ.get('PAYMENT_WORKERS', 2))
+    app.config['PAYMENT_BATCH'] = int(os.environ.get('PAYMENT_BATCH', 20))
+    
+    if config:
+        app.config.update(config)
     
     db.init_app(app)
+    init_database(app)
+    
+    from app.passwords import init_passwords
+    init_passwords(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Por favor, faça login para acessar esta página.'
@@ -40,14 +73,65 @@ def create_app():
     app.register_blueprint(reviews_bp)
     app.register_blueprint(payment_bp, url_prefix='/pagamento')
     
+    from app.search import search_cli, init_search
+    app.cli.add_command(search_cli)
+    
+    from app.migrations import db_cli, upgrade
+    app.cli.add_command(db_cli)
+    
+    from app.product_import import products_cli
+    app.cli.add_command(products_cli)
+    
+    from app.sales import sales_cli
+    app.cli.add_command(sales_cli)
+    
+    from app.ratings import ratings_cli
+    app.cli.add_command(ratings_cli)
+    
+    from app.benchmarks import bench_cli
+    app.cli.add_command(bench_cli)
+    
+    from app.inventory import reservations_cli, init_reservations
+    app.cli.add_command(reservations_cli)
+    init_reservations(app)
+    
+    from app.payment_queue import payments_cli, init_payment_queue
+    app.cli.add_command(payments_cli)
+    init_payment_queue(app)
+    
+    from app.maintenance import maintenance_cli, init_maintenance
+    app.cli.add_command(maintenance_cli)
+    init_maintenance(app)
+    
+    from app.nplusone import init_nplusone
+    init_nplusone(app)
+    
+    from app.cache import category_cache, init_catalog_cache
+    init_catalog_cache(app)
+    
+    from app.page_cache import init_page_cache
+    init_page_cache(app)
+    
+    from app.assets import assets_cli, init_assets
+    app.cli.add_command(assets_cli)
+    if not app.debug:
+        init_assets(app)
+    
+    from app.images import images_cli, init_images
+    app.cli.add_command(images_cli)
+    init_images(app)
+    
+    from app.wishlists import init_wishlists
+    init_wishlists(app)
+    
     @app.context_processor
     def inject_categories():
-        from app.models import Category
-        categories = Category.query.all()
-        return dict(categories=categories)
+        return dict(categories=category_cache.all())
     
     with app.app_context():
         db.create_all()
+        upgrade()
+        init_search(app)
         from app.models import User, Category, Product
         
         if User.query.count() == 0:
@@ -0,0 +1,185 @@
+from flask import request, send_file, current_app
+from flask.cli import AppGroup
+from werkzeug.exceptions import NotFound
+import click
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import tempfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Arquivos com hash no nome nunca mudam: podem ficar um ano no cache do navegador
+IMMUTABLE_MAX_AGE = 31536000
+
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.ttf', '.eot', '.otf', '.map'}
+MIN_COMPRESS_SIZE = 512
+
+# Uploads do admin entram em images/ durante a execução e ficam fora do pipeline
+SKIPPED_DIRS = {'images'}
+
+_CSS_URL_RE = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+class StaticAssets:
+    def __init__(self, static_folder, output_dir):
+        self.static_folder = static_folder
+        self.output_dir = output_dir
+        self.manifest = {}
+        self.reverse = {}
+        self.version = ''
+
+    def _sources(self):
+        for root, dirs, files in os.walk(self.static_folder):
+            rel_root = os.path.relpath(root, self.static_folder)
+            if rel_root == '.':
+                dirs[:] = [d for d in dirs if d not in SKIPPED_DIRS]
+            for name in files:
+                path = os.path.join(root, name)
+                yield posixpath.normpath(os.path.relpath(path, self.static_folder).replace(os.sep, '/')), path
+
+    def _rewrite_css(self, source, data):
+        # url(../fonts/x.woff2?v=1) -> url(../fonts/x.<hash>.woff2?v=1)
+        base = posixpath.dirname(source)
+
+        def replace(match):
+            quote, url = match.groups()
+            if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+                return match.group(0)
+            path, sep, suffix = (re.split(r'([?#])', url, maxsplit=1) + ['', ''])[:3]
+            target = posixpath.normpath(posixpath.join(base, path))
+            hashed = self.manifest.get(target)
+            if not hashed:
+                return match.group(0)
+            new_path = posixpath.relpath(hashed, base)
+            return f'url({quote}{new_path}{sep}{suffix}{quote})'
+
+        return _CSS_URL_RE.sub(replace, data.decode('utf-8')).encode('utf-8')
+
+    def _write(self, name, data):
+        path = os.path.join(self.output_dir, name)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return True
+
+    def build(self):
+        # CSS por último: as referências internas precisam dos nomes finais das fontes/imagens
+        sources = sorted(self._sources(), key=lambda s: (s[0].endswith('.css'), s[0]))
+        manifest = {}
+        self.manifest = manifest
+        written = 0
+        for name, path in sources:
+            with open(path, 'rb') as f:
+                data = f.read()
+            if name.endswith('.css'):
+                data = self._rewrite_css(name, data)
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            stem, ext = posixpath.splitext(name)
+            hashed = f'{stem}.{digest}{ext}'
+            manifest[name] = hashed
+
+            written += self._write(hashed, data)
+            if ext.lower() in COMPRESSIBLE and len(data) >= MIN_COMPRESS_SIZE:
+                written += self._write(hashed + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    written += self._write(hashed + '.br', brotli.compress(data, quality=11))
+
+        self.reverse = {hashed: name for name, hashed in manifest.items()}
+        self.version = hashlib.sha1(json.dumps(manifest, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        self._write_manifest()
+        return written
+
+    def _write_manifest(self):
+        path = os.path.join(self.output_dir, 'manifest.json')
+        os.makedirs(self.output_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.output_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+
+    def url_defaults(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = self.manifest.get(values['filename'], values['filename'])
+
+    def _variant(self, hashed):
+        # Escolhe a variante pré-comprimida aceita pelo cliente
+        path = os.path.join(self.output_dir, hashed)
+        accepted = request.accept_encodings
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[encoding] and os.path.exists(path + suffix):
+                return path + suffix, encoding
+        return path, None
+
+    def serve(self, filename):
+        if filename not in self.reverse:
+            return current_app.send_static_file(filename)
+        path, encoding = self._variant(filename)
+        if not os.path.exists(path):
+            raise NotFound()
+        mimetype = mimetypes.guess_type(self.reverse[filename])[0] or 'application/octet-stream'
+        response = send_file(path, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE, conditional=True, etag=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+def init_assets(app):
+    if not app.config.get('STATIC_FINGERPRINT', True) or app.static_folder is None:
+        return None
+    output_dir = app.config.get('STATIC_BUILD_DIR') or os.path.join(app.instance_path, 'static_build')
+    assets = StaticAssets(app.static_folder, output_dir)
+    try:
+        written = assets.build()
+    except OSError:
+        logger.exception('Falha ao gerar os arquivos estáticos versionados; servindo os originais')
+        return None
+    if written:
+        logger.info('%s arquivo(s) estático(s) versionado(s) gerado(s) em %s', written, output_dir)
+    app.extensions['static_assets'] = assets
+    app.url_defaults(assets.url_defaults)
+    app.view_functions['static'] = assets.serve
+    return assets
+
+
+assets_cli = AppGroup('assets', help='Arquivos estáticos versionados e pré-comprimidos.')
+
+
+@assets_cli.command('build')
+@click.option('--clean', is_flag=True, help='Remove versões antigas que não estão mais no manifesto.')
+def build_command(clean):
+    assets = current_app.extensions.get('static_assets')
+    if assets is None:
+        raise click.ClickException('Pipeline desativado (STATIC_FINGERPRINT=0 ou modo debug).')
+    written = assets.build()
+    click.echo(f'{len(assets.manifest)} arquivo(s) no manifesto, {written} gerado(s) em {assets.output_dir}.')
+    if brotli is None:
+        click.echo('Aviso: brotli não instalado, só as versões .gz foram geradas (pip install Brotli).')
+    if clean:
+        keep = set(assets.manifest.values())
+        removed = 0
+        for root, _, files in os.walk(assets.output_dir):
+            for name in files:
+                rel = os.path.relpath(os.path.join(root, name), assets.output_dir).replace(os.sep, '/')
+                base = rel[:-3] if rel.endswith(('.gz', '.br')) else rel
+                if rel != 'manifest.json' and base not in keep:
+                    os.unlink(os.path.join(root, name))
+                    removed += 1
+        click.echo(f'{removed} arquivo(s) antigo(s) removido(s).')
@@ -0,0 +1,175 @@
+from flask.cli import AppGroup
+import multiprocessing
+import os
+import tempfile
+import time
+import click
+
+bench_cli = AppGroup('bench', help='Benchmarks locais (usam um banco temporário).')
+
+BENCH_PRODUCT_CODE = 'BENCH-STOCK'
+
+BENCH_PASSWORD_METHODS = ('pbkdf2:sha256:600000', 'scrypt:16384:8:1', 'scrypt:32768:8:1', 'scrypt:65536:8:1')
+
+
+def _bench_app(database_uri):
+    from app import create_app
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'NPLUSONE_DETECTION': 'off',
+        'RESERVATION_SWEEP_INTERVAL': 0,
+        'PAYMENT_WORKER_INTERVAL': 0,
+        'MAINTENANCE_INTERVAL': 0,
+    })
+
+
+def _seed_checkout(database_uri, users, stock):
+    from app import db
+    from app.models import User, Product, Category
+    app = _bench_app(database_uri)
+    with app.app_context():
+        category = Category.query.first()
+        product = Product(name='Produto de benchmark', code=BENCH_PRODUCT_CODE, price=10.0,
+                          stock=stock, category_id=category.id if category else None)
+        db.session.add(product)
+        accounts = []
+        for i in range(users):
+            user = User(username=f'bench{i}', email=f'bench{i}@bench.local', password_hash='!')
+            db.session.add(user)
+            accounts.append(user)
+        db.session.commit()
+        return product.id, [u.id for u in accounts]
+
+
+def _checkout_worker(database_uri, product_id, user_ids, attempts, barrier, queue):
+    from app import db
+    from app.models import CartItem
+    app = _bench_app(database_uri)
+    client = app.test_client()
+    ok = rejected = errors = 0
+    barrier.wait()
+    for i in range(attempts):
+        user_id = user_ids[i % len(user_ids)]
+        with app.app_context():
+            try:
+                if not CartItem.query.filter_by(user_id=user_id).first():
+                    db.session.add(CartItem(user_id=user_id, product_id=product_id, quantity=1))
+                    db.session.commit()
+            except Exception:
+                db.session.rollback()
+                errors += 1
+                continue
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+            sess['_fresh'] = True
+        response = client.post('/finalizar-compra', data={
+            'delivery_type': 'pickup',
+            'customer_name': 'Bench',
+            'customer_phone': '31999999999',
+        })
+        if response.status_code >= 500:
+            errors += 1
+        elif '/pagamento/criar-preferencia' in response.headers.get('Location', ''):
+            ok += 1
+        else:
+            rejected += 1
+    queue.put((ok, rejected, errors))
+
+
+@bench_cli.command('checkout')
+@click.option('--workers', default=4, show_default=True, help='Processos concorrentes.')
+@click.option('--attempts', default=50, show_default=True, help='Tentativas de compra por processo.')
+@click.option('--stock', default=100, show_default=True, help='Estoque inicial do produto disputado.')
+@click.option('--users', default=4, show_default=True, help='Clientes por processo.')
+def checkout_benchmark(workers, attempts, stock, users):
+    from sqlalchemy import create_engine, text
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_uri = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        product_id, user_ids = _seed_checkout(database_uri, workers * users, stock)
+
+        ctx = multiprocessing.get_context('spawn')
+        queue = ctx.Queue()
+        barrier = ctx.Barrier(workers + 1)
+        processes = [
+            ctx.Process(
+                target=_checkout_worker,
+                args=(database_uri, product_id, user_ids[i * users:(i + 1) * users], attempts, barrier, queue)
+            )
+            for i in range(workers)
+        ]
+        for p in processes:
+            p.start()
+        # Só começa a medir depois que todos os processos subiram o app
+        barrier.wait()
+        started = time.perf_counter()
+        results = [queue.get() for _ in processes]
+        elapsed = time.perf_counter() - started
+        for p in processes:
+            p.join()
+
+        ok = sum(r[0] for r in results)
+        rejected = sum(r[1] for r in results)
+        errors = sum(r[2] for r in results)
+
+        engine = create_engine(database_uri)
+        with engine.connect() as conn:
+            final_stock = conn.execute(text('SELECT stock FROM product WHERE id = :id'), {'id': product_id}).scalar()
+            sold = conn.execute(
+                text('SELECT COALESCE(SUM(quantity), 0) FROM order_item WHERE product_id = :id'), {'id': product_id}
+            ).scalar()
+        engine.dispose()
+
+    oversold = max(0, sold - stock) + max(0, -final_stock)
+    click.echo(f'processos: {workers}  tentativas: {workers * attempts}  estoque inicial: {stock}')
+    click.echo(f'pedidos criados: {ok}  recusados (sem estoque): {rejected}  erros: {errors}')
+    click.echo(f'vendidos: {sold}  estoque final: {final_stock}  overselling: {oversold}')
+    click.echo(f'tempo: {elapsed:.2f}s  checkouts/s: {ok / elapsed:.1f}')
+    if oversold or sold + final_stock != stock:
+        raise click.ClickException('Inconsistência de estoque detectada.')
+
+
+def _verify_loop(verify, stored, deadline, counts):
+    done = 0
+    while time.perf_counter() < deadline:
+        verify(stored, 'bench-password')
+        done += 1
+    counts.append(done)
+
+
+@bench_cli.command('passwords')
+@click.option('--method', 'methods', multiple=True, help='Método do Werkzeug (repetível). Padrão: uma seleção de scrypt/pbkdf2.')
+@click.option('--seconds', default=3.0, show_default=True, help='Duração de cada medição.')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='Threads do pool de hash.')
+def passwords_benchmark(methods, seconds, workers):
+    import threading
+    from werkzeug.security import generate_password_hash, check_password_hash
+    from app.passwords import PasswordHasher
+
+    click.echo(f'núcleos: {os.cpu_count()}  threads do pool: {workers}  {seconds:.0f}s por medição')
+    click.echo(f'{"método":<24} {"ms/login":>9} {"logins/s/núcleo":>16} {"logins/s (pool)":>16}')
+    for method in methods or BENCH_PASSWORD_METHODS:
+        stored = generate_password_hash('bench-password', method)
+
+        # Uma thread: custo de uma verificação em um núcleo
+        counts = []
+        started = time.perf_counter()
+        _verify_loop(check_password_hash, stored, started + seconds, counts)
+        per_core = counts[0] / (time.perf_counter() - started)
+
+        # Pool: o dobro de clientes disputando `workers` threads, como numa rajada de logins
+        hasher = PasswordHasher(method, workers=workers, max_queue=workers * 2, timeout=60)
+        counts = []
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(target=_verify_loop, args=(hasher.verify, stored, started + seconds, counts))
+            for _ in range(workers * 2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        pooled = sum(counts) / (time.perf_counter() - started)
+        hasher.shutdown()
+
+        click.echo(f'{hasher.method:<24} {1000 / per_core:>9.1f} {per_core:>16.1f} {pooled:>16.1f}')
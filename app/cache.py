@@ -0,0 +1,215 @@
+from collections import namedtuple
+from datetime import datetime
+from types import MappingProxyType
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+import hashlib
+import threading
+import time
+
+CategorySnapshot = namedtuple('CategorySnapshot', ['id', 'name', 'description', 'image_url', 'created_at', 'updated_at'])
+ProductCard = namedtuple('ProductCard', ['id', 'name', 'code', 'price', 'image_url', 'category_id', 'rating_avg', 'rating_count'])
+SlideSnapshot = namedtuple('SlideSnapshot', ['id', 'title', 'image_url', 'link'])
+HomePage = namedtuple('HomePage', ['featured', 'category_products', 'slides'])
+
+HOME_FEATURED_LIMIT = 12
+HOME_PER_CATEGORY_LIMIT = 6
+
+
+class SnapshotCache:
+    # Cache por processo de um único valor imutável, reconstruído sob demanda
+    # depois de invalidado ou quando o TTL expira (converge entre workers).
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._value = None
+        self._signature = None
+        self.changed_at = None
+        self._loaded_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def _expired(self):
+        return self.ttl is not None and time.monotonic() - self._loaded_at > self.ttl
+
+    def _build(self):
+        raise NotImplementedError
+
+    def _store(self, value):
+        self._value = value
+
+    def get_value(self):
+        value = self._value
+        if value is not None and not self._expired():
+            self.hits += 1
+            return value
+        with self._lock:
+            if self._value is None or self._expired():
+                self.misses += 1
+                self._store(self._build())
+                signature = hashlib.sha1(repr(self._value).encode('utf-8')).hexdigest()
+                if signature != self._signature:
+                    self._signature = signature
+                    self.changed_at = datetime.utcnow()
+                self._loaded_at = time.monotonic()
+            else:
+                self.hits += 1
+            return self._value
+
+    def signature(self):
+        # Hash do conteúdo do snapshot atual; base dos ETags das páginas do catálogo.
+        # changed_at só avança quando o conteúdo muda de fato.
+        self.get_value()
+        return self._signature
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'loaded': self._value is not None,
+            'ttl': self.ttl,
+        }
+
+
+class CategoryCache(SnapshotCache):
+    def __init__(self, ttl=300):
+        super().__init__(ttl)
+        self._by_id = {}
+
+    def _build(self):
+        from app.models import Category
+        rows = Category.query.order_by(Category.id).all()
+        return tuple(
+            CategorySnapshot(c.id, c.name, c.description, c.image_url, c.created_at, c.updated_at)
+            for c in rows
+        )
+
+    def _store(self, value):
+        self._by_id = {c.id: c for c in value}
+        self._value = value
+
+    def all(self):
+        return self.get_value()
+
+    def get(self, category_id):
+        self.get_value()
+        return self._by_id.get(category_id)
+
+
+class HomePageCache(SnapshotCache):
+    def _build(self):
+        from app import db
+        from app.models import Product, Slide
+        from sqlalchemy import func
+        from sqlalchemy.orm import aliased
+
+        featured = Product.query.filter_by(featured=True, active=True).order_by(Product.id).limit(HOME_FEATURED_LIMIT).all()
+        if not featured:
+            featured = Product.query.filter_by(active=True).order_by(Product.id).limit(HOME_FEATURED_LIMIT).all()
+
+        # Top-N produtos ativos por categoria em uma única consulta (ROW_NUMBER)
+        ranked = db.session.query(
+            Product,
+            func.row_number().over(
+                partition_by=Product.category_id,
+                order_by=Product.id
+            ).label('position')
+        ).filter(Product.active == True).subquery()
+        ranked_product = aliased(Product, ranked)
+        rows = db.session.query(ranked_product).filter(
+            ranked.c.position <= HOME_PER_CATEGORY_LIMIT
+        ).order_by(ranked.c.category_id, ranked.c.position).all()
+
+        category_products = {}
+        for product in rows:
+            category_products.setdefault(product.category_id, []).append(_product_card(product))
+
+        slides = Slide.query.filter_by(active=True).order_by(Slide.order, Slide.created_at.desc()).all()
+
+        return HomePage(
+            featured=tuple(_product_card(p) for p in featured),
+            category_products=MappingProxyType({k: tuple(v) for k, v in category_products.items()}),
+            slides=tuple(SlideSnapshot(s.id, s.title, s.image_url, s.link) for s in slides),
+        )
+
+    def get(self):
+        return self.get_value()
+
+
+def _product_card(product):
+    return ProductCard(
+        product.id, product.name, product.code, product.price, product.image_url, product.category_id,
+        product.rating_avg or 0, product.rating_count or 0
+    )
+
+
+category_cache = CategoryCache()
+home_page_cache = HomePageCache()
+
+# Colunas de Product que não aparecem nos snapshots do catálogo
+_IGNORED_PRODUCT_COLUMNS = {'stock', 'updated_at'}
+
+
+def _touches_catalog(obj, deleted=False):
+    from app.models import Category, Product, Slide
+    if not isinstance(obj, (Category, Product, Slide)):
+        return None
+    if isinstance(obj, Product) and not deleted and inspect(obj).persistent:
+        state = inspect(obj)
+        changed = {
+            attr.key for attr in state.attrs
+            if attr.key not in _IGNORED_PRODUCT_COLUMNS and attr.history.has_changes()
+        }
+        if not changed:
+            return None
+    return type(obj).__name__
+
+
+def _collect_catalog_changes(session, flush_context):
+    touched = session.info.setdefault('catalog_changes', set())
+    for obj in session.new:
+        name = _touches_catalog(obj)
+        if name:
+            touched.add(name)
+    for obj in session.dirty:
+        name = _touches_catalog(obj)
+        if name:
+            touched.add(name)
+    for obj in session.deleted:
+        name = _touches_catalog(obj, deleted=True)
+        if name:
+            touched.add(name)
+
+
+def _apply_catalog_changes(session):
+    touched = session.info.pop('catalog_changes', None)
+    if not touched:
+        return
+    if 'Category' in touched:
+        category_cache.invalidate()
+    home_page_cache.invalidate()
+
+
+def _discard_catalog_changes(session):
+    session.info.pop('catalog_changes', None)
+
+
+def init_catalog_cache(app):
+    ttl = app.config.get('CATALOG_CACHE_TTL')
+    category_cache.ttl = ttl
+    home_page_cache.ttl = ttl
+    if not event.contains(Session, 'after_flush', _collect_catalog_changes):
+        event.listen(Session, 'after_flush', _collect_catalog_changes)
+        event.listen(Session, 'after_commit', _apply_catalog_changes)
+        event.listen(Session, 'after_rollback', _discard_catalog_changes)
+
+
+def cache_stats():
+    return {
+        'categories': category_cache.stats(),
+        'home_page': home_page_cache.stats(),
+    }
@@ -0,0 +1,105 @@
+from sqlalchemy import event, text
+from app.periodic import PeriodicTask
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATABASE_URI = 'sqlite:///ecommerce.db'
+
+# Perfis de PRAGMA aplicados em cada nova conexão SQLite
+SQLITE_PROFILES = {
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    },
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+        'cache_size': -16000,
+        'temp_store': 'MEMORY',
+    },
+    'legacy': {},
+}
+
+
+def database_config(environ=None):
+    environ = os.environ if environ is None else environ
+    uri = environ.get('DATABASE_URL', DEFAULT_DATABASE_URI)
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+
+    config = {
+        'SQLALCHEMY_DATABASE_URI': uri,
+        'SQLITE_PROFILE': environ.get('SQLITE_PROFILE', 'production'),
+        'SQLITE_BUSY_TIMEOUT': int(environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+        'DB_CHECKPOINT_INTERVAL': int(environ.get('DB_CHECKPOINT_INTERVAL', 300)),
+    }
+
+    if uri.startswith('sqlite'):
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000},
+        }
+    else:
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_size': int(environ.get('DB_POOL_SIZE', 5)),
+            'max_overflow': int(environ.get('DB_MAX_OVERFLOW', 10)),
+            'pool_timeout': int(environ.get('DB_POOL_TIMEOUT', 10)),
+            'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 1800)),
+            'pool_pre_ping': True,
+        }
+    return config
+
+
+def sqlite_pragmas(app):
+    pragmas = dict(SQLITE_PROFILES.get(app.config.get('SQLITE_PROFILE'), SQLITE_PROFILES['production']))
+    if 'busy_timeout' in pragmas and app.config.get('SQLITE_BUSY_TIMEOUT'):
+        pragmas['busy_timeout'] = app.config['SQLITE_BUSY_TIMEOUT']
+    return pragmas
+
+
+def _apply_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+    return on_connect
+
+
+def checkpoint_wal():
+    from app import db
+    with db.engine.connect() as conn:
+        return conn.execute(text('PRAGMA wal_checkpoint(PASSIVE)')).first()
+
+
+def optimize_database():
+    from app import db
+    with db.engine.connect() as conn:
+        conn.execute(text('PRAGMA optimize'))
+
+
+def init_database(app):
+    from app import db
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = sqlite_pragmas(app)
+    if pragmas:
+        event.listen(engine, 'connect', _apply_pragmas(pragmas))
+
+    if app.testing:
+        return
+    if pragmas.get('journal_mode') == 'WAL' and app.config.get('DB_CHECKPOINT_INTERVAL'):
+        task = PeriodicTask(app, app.config['DB_CHECKPOINT_INTERVAL'], checkpoint_wal, 'sqlite-wal-checkpoint')
+        app.extensions['sqlite_checkpoint'] = task
+        task.start()
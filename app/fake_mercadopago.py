@@ -0,0 +1,137 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode
+import itertools
+import json
+import re
+import threading
+import time
+
+# Dublê do mercadopago.SDK para desenvolvimento local e testes (MERCADOPAGO_FAKE=1).
+# Guarda pagamentos em memória e responde no mesmo formato do SDK:
+# {'status': <código HTTP>, 'response': {...}}
+
+
+class FakeSDK:
+    def __init__(self, latency=0.0, failures=0):
+        # latency: segundos de espera por chamada; failures: quantas chamadas
+        # seguidas de payment().get respondem 500 antes de voltar ao normal
+        self.latency = latency
+        self.failures = failures
+        self.payments = {}
+        self.calls = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add_payment(self, status, external_reference, payment_id=None, **extra):
+        with self._lock:
+            payment_id = str(payment_id or 9000000000 + next(self._ids))
+            self.payments[payment_id] = {
+                'id': int(payment_id),
+                'status': status,
+                'external_reference': str(external_reference),
+                **extra,
+            }
+        return payment_id
+
+    def set_status(self, payment_id, status):
+        with self._lock:
+            self.payments[str(payment_id)]['status'] = status
+
+    def payment(self):
+        return _FakePayment(self)
+
+    def preference(self):
+        return _FakePreference(self)
+
+    def _call(self):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            if self.failures > 0:
+                self.failures -= 1
+                return False
+        return True
+
+
+class _FakePayment:
+    def __init__(self, sdk):
+        self.sdk = sdk
+
+    def get(self, payment_id):
+        if not self.sdk._call():
+            return {'status': 500, 'response': {'message': 'internal_error'}}
+        payment = self.sdk.payments.get(str(payment_id))
+        if payment is None:
+            return {'status': 404, 'response': {'message': 'Payment not found'}}
+        return {'status': 200, 'response': dict(payment)}
+
+
+class _FakePreference:
+    def __init__(self, sdk):
+        self.sdk = sdk
+
+    def create(self, preference_data):
+        self.sdk._call()
+        # O "checkout" aprova na hora e volta direto para a URL de sucesso
+        reference = preference_data.get('external_reference')
+        payment_id = self.sdk.add_payment('approved', reference)
+        query = urlencode({
+            'payment_id': payment_id,
+            'status': 'approved',
+            'external_reference': reference,
+        })
+        return {'status': 201, 'response': {
+            'id': f'fake-{payment_id}',
+            'init_point': f"{preference_data['back_urls']['success']}?{query}",
+        }}
+
+
+class _ProviderHandler(BaseHTTPRequestHandler):
+    # Rotas da API usadas pela loja, respondidas pelo FakeSDK do servidor
+    protocol_version = 'HTTP/1.1'
+    payment_re = re.compile(r'^/v1/payments/(\w+)$')
+
+    def do_GET(self):
+        match = self.payment_re.match(self.path.split('?')[0])
+        if not match:
+            return self._send({'status': 404, 'response': {'message': 'not found'}})
+        self._send(self.server.sdk.payment().get(match.group(1)))
+
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        data = self._body()
+        if path == '/checkout/preferences':
+            return self._send(self.server.sdk.preference().create(data))
+        if path == '/fake/payments':
+            # Cria um pagamento para simular notificações: {"status", "external_reference"}
+            payment_id = self.server.sdk.add_payment(data.get('status', 'approved'), data.get('external_reference'))
+            return self._send({'status': 201, 'response': {'id': int(payment_id)}})
+        self._send({'status': 404, 'response': {'message': 'not found'}})
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return {}
+
+    def _send(self, result):
+        body = json.dumps(result['response']).encode()
+        self.send_response(result['status'])
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_provider_server(host='127.0.0.1', port=8081, latency=0.0, failures=0):
+    # Servidor HTTP local no lugar de api.mercadopago.com para testes de carga
+    # sem rede: aponte MERCADOPAGO_API_BASE para http://host:port
+    server = ThreadingHTTPServer((host, port), _ProviderHandler)
+    server.daemon_threads = True
+    server.sdk = FakeSDK(latency=latency, failures=failures)
+    return server
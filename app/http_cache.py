@@ -0,0 +1,61 @@
+from flask import request, session, make_response, current_app
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+import hashlib
+import os
+
+_TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+_template_version = None
+
+
+def template_version():
+    # Muda a cada deploy que altera templates: páginas antigas não casam mais com o ETag
+    global _template_version
+    if _template_version is None:
+        latest = 0
+        for root, _, files in os.walk(_TEMPLATES_DIR):
+            for name in files:
+                latest = max(latest, os.stat(os.path.join(root, name)).st_mtime_ns)
+        _template_version = str(latest)
+    # Os nomes versionados dos estáticos também entram no HTML
+    assets = current_app.extensions.get('static_assets')
+    return f'{_template_version}:{assets.version}' if assets else _template_version
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def is_shared_request():
+    # Só visitantes anônimos sem mensagens flash pendentes recebem a versão
+    # compartilhável (e revalidável) da página
+    return not current_user.is_authenticated and not session.get('_flashes')
+
+
+def _latest(dates):
+    dates = [d for d in dates if d is not None]
+    return max(dates).replace(microsecond=0) if dates else None
+
+
+def conditional_page(render, etag_parts, last_modified=()):
+    # render só é chamado quando o cliente não tem a versão atual (sem 304)
+    if not is_shared_request():
+        response = make_response(render())
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+        return response
+
+    etag = make_etag(template_version(), request.full_path, *etag_parts)
+    modified = _latest(last_modified)
+    if is_resource_modified(request.environ, etag=etag, last_modified=modified):
+        response = make_response(render())
+    else:
+        response = make_response('', 304)
+    response.set_etag(etag, weak=True)
+    if modified:
+        response.last_modified = modified
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
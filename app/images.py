@@ -0,0 +1,252 @@
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from flask.cli import AppGroup
+from markupsafe import Markup, escape
+import click
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Larguras geradas para cada imagem (nunca maiores que a original)
+WIDTHS = (160, 320, 640, 1024)
+# (extensão, formato do Pillow, opções de gravação)
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 6}),
+    ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+SOURCE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
+IMAGES_PREFIX = '/static/images/'
+DERIVED_DIR = '_derived'
+DEFAULT_SIZES = '(max-width: 576px) 50vw, (max-width: 992px) 33vw, 250px'
+
+
+def _images_folder():
+    return os.path.join(current_app.static_folder, 'images')
+
+
+def _derived_folder(images_folder):
+    return os.path.join(images_folder, DERIVED_DIR)
+
+
+def _info_path(images_folder, name):
+    return os.path.join(_derived_folder(images_folder), os.path.splitext(name)[0] + '.json')
+
+
+def _write_atomic(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def _flatten(image):
+    # JPEG não tem transparência: compõe sobre fundo branco
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def process_image(images_folder, name, force=False):
+    # Gera as variantes de images/<name> em images/_derived e grava um .json
+    # com as dimensões. Idempotente: pula se o .json for mais novo que a origem.
+    source = os.path.join(images_folder, name)
+    info_path = _info_path(images_folder, name)
+    if not force and os.path.exists(info_path) and os.path.getmtime(info_path) >= os.path.getmtime(source):
+        return None
+
+    with open(source, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:8]
+
+    derived = _derived_folder(images_folder)
+    os.makedirs(derived, exist_ok=True)
+    stem = os.path.splitext(name)[0]
+
+    with Image.open(source) as original:
+        original.seek(0)
+        # Aplica a rotação do EXIF antes de descartar os metadados
+        image = ImageOps.exif_transpose(original)
+        image.load()
+    width, height = image.size
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+    targets = sorted({w for w in WIDTHS if w < width} | {min(width, WIDTHS[-1])})
+    variants = []
+    for target in targets:
+        target_height = max(1, round(height * target / width))
+        resized = image if target == width else image.resize((target, target_height), Image.LANCZOS)
+        files = {}
+        for ext, fmt, options in FORMATS:
+            filename = f'{stem}.{digest}.{target}.{ext}'
+            path = os.path.join(derived, filename)
+            if not os.path.exists(path):
+                frame = _flatten(resized) if fmt == 'JPEG' else resized
+                fd, tmp = tempfile.mkstemp(dir=derived)
+                with os.fdopen(fd, 'wb') as f:
+                    # Sem exif/icc: os metadados da origem ficam de fora
+                    frame.save(f, fmt, **options)
+                os.replace(tmp, path)
+            files[ext] = f'{IMAGES_PREFIX}{DERIVED_DIR}/{filename}'
+        variants.append({'width': target, 'height': target_height, **files})
+
+    info = {'width': width, 'height': height, 'digest': digest, 'variants': variants}
+    _write_atomic(info_path, json.dumps(info).encode('utf-8'))
+    return info
+
+
+class ImagePipeline:
+    def __init__(self):
+        self.executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._info = {}
+
+    @property
+    def enabled(self):
+        return Image is not None and self.executor is not None
+
+    def init_app(self, app):
+        if Image is None:
+            logger.warning('Pillow não instalado: imagens enviadas serão servidas sem variantes')
+            return
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=app.config.get('IMAGE_WORKERS', 2), thread_name_prefix='image-pipeline'
+            )
+
+    def _run(self, images_folder, name):
+        try:
+            process_image(images_folder, name)
+        except Exception:
+            logger.exception('Falha ao gerar variantes de %s', name)
+        finally:
+            with self._lock:
+                self._pending.discard(name)
+
+    def schedule(self, image_url):
+        # Chamado após o upload: a requisição do admin volta sem esperar o Pillow
+        name = local_image_name(image_url)
+        if name is None or not self.enabled:
+            return False
+        with self._lock:
+            if name in self._pending:
+                return False
+            self._pending.add(name)
+        self.executor.submit(self._run, _images_folder(), name)
+        return True
+
+    def info(self, image_url):
+        name = local_image_name(image_url)
+        if name is None:
+            return None
+        path = _info_path(_images_folder(), name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached = self._info.get(name)
+        if cached is None or cached[0] != mtime:
+            try:
+                with open(path, 'rb') as f:
+                    cached = (mtime, json.load(f))
+            except (OSError, ValueError):
+                return None
+            self._info[name] = cached
+        return cached[1]
+
+
+image_pipeline = ImagePipeline()
+
+
+def local_image_name(image_url):
+    if not image_url or not image_url.startswith(IMAGES_PREFIX):
+        return None
+    name = image_url[len(IMAGES_PREFIX):]
+    if '/' in name or os.path.splitext(name)[1].lower() not in SOURCE_EXTENSIONS:
+        return None
+    return name
+
+
+def _attrs(attrs):
+    return Markup(''.join(f' {key.replace("_", "-")}="{escape(value)}"' for key, value in attrs.items() if value is not None))
+
+
+def responsive_image(image_url, alt='', sizes=DEFAULT_SIZES, **attrs):
+    # <picture> com WebP + JPEG em várias larguras e width/height para reservar o espaço.
+    # Sem variantes (URL externa ou ainda processando) cai no <img> simples.
+    info = image_pipeline.info(image_url)
+    if not info or not info['variants']:
+        return Markup('<img src="{}" alt="{}"{}>').format(image_url or '', alt, _attrs(attrs))
+
+    variants = info['variants']
+    largest = variants[-1]
+    webp = ', '.join(f"{v['webp']} {v['width']}w" for v in variants)
+    jpeg = ', '.join(f"{v['jpg']} {v['width']}w" for v in variants)
+    return Markup(
+        '<picture><source type="image/webp" srcset="{webp}" sizes="{sizes}">'
+        '<img src="{src}" srcset="{jpeg}" sizes="{sizes}" width="{width}" height="{height}" alt="{alt}"{attrs}>'
+        '</picture>'
+    ).format(
+        webp=webp, jpeg=jpeg, sizes=sizes, src=largest['jpg'],
+        width=largest['width'], height=largest['height'], alt=alt, attrs=_attrs(attrs),
+    )
+
+
+def init_images(app):
+    image_pipeline.init_app(app)
+    app.jinja_env.globals['responsive_image'] = responsive_image
+
+
+images_cli = AppGroup('images', help='Variantes redimensionadas (WebP/JPEG) das imagens enviadas.')
+
+
+@images_cli.command('build')
+@click.option('--force', is_flag=True, help='Regera variantes já existentes.')
+@click.option('--workers', default=None, type=int, help='Threads em paralelo (padrão: IMAGE_WORKERS).')
+def build_command(force, workers):
+    if Image is None:
+        raise click.ClickException('Pillow não está instalado (pip install Pillow).')
+    images_folder = _images_folder()
+    names = sorted(
+        name for name in os.listdir(images_folder)
+        if os.path.isfile(os.path.join(images_folder, name))
+        and os.path.splitext(name)[1].lower() in SOURCE_EXTENSIONS
+    )
+    workers = workers or current_app.config.get('IMAGE_WORKERS', 2)
+    processed = skipped = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_image, images_folder, name, force): name for name in names}
+        for future, name in futures.items():
+            try:
+                info = future.result()
+            except Exception as exc:
+                failed += 1
+                click.echo(f'FALHA {name}: {exc}')
+                continue
+            if info is None:
+                skipped += 1
+            else:
+                processed += 1
+                click.echo(f"{name} {info['width']}x{info['height']} -> {len(info['variants'])} largura(s)")
+    click.echo(f'{processed} processada(s), {skipped} já atualizada(s), {failed} com falha.')
+    if failed:
+        raise click.ClickException(f'{failed} imagem(ns) com falha.')
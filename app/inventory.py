@@ -0,0 +1,179 @@
+from datetime import datetime
+from flask.cli import AppGroup
+from sqlalchemy import update, select, or_
+from app import db
+from app.models import Product, Coupon, Order, StockReservation
+from app.page_cache import invalidate_on_commit
+from app.periodic import PeriodicTask
+import click
+import logging
+
+logger = logging.getLogger(__name__)
+
+RESERVED = 'reserved'
+COMMITTED = 'committed'
+RELEASED = 'released'
+
+DEFAULT_SWEEP_BATCH = 200
+
+
+class OutOfStockError(Exception):
+    def __init__(self, product_id):
+        super().__init__(f'Produto {product_id} sem estoque suficiente')
+        self.product_id = product_id
+
+
+class CouponExhaustedError(Exception):
+    pass
+
+
+def _invalidate_product_pages(lines):
+    # A página do produto mostra o estoque; o cache dela cai quando a transação confirmar
+    invalidate_on_commit(db.session, {f'product:{product_id}' for product_id, _ in lines})
+
+
+def decrement_stock(lines):
+    # lines: [(product_id, quantity)]. Cada UPDATE só afeta a linha se ainda
+    # houver estoque; rowcount 0 significa que outro pedido levou o estoque.
+    for product_id, quantity in lines:
+        result = db.session.execute(
+            update(Product.__table__)
+            .where(Product.__table__.c.id == product_id)
+            .where(Product.__table__.c.stock >= quantity)
+            .values(stock=Product.__table__.c.stock - quantity)
+        )
+        if result.rowcount != 1:
+            raise OutOfStockError(product_id)
+    _invalidate_product_pages(lines)
+
+
+def increment_stock(lines):
+    for product_id, quantity in lines:
+        db.session.execute(
+            update(Product.__table__)
+            .where(Product.__table__.c.id == product_id)
+            .values(stock=Product.__table__.c.stock + quantity)
+        )
+    _invalidate_product_pages(lines)
+
+
+def consume_coupon(coupon_id):
+    table = Coupon.__table__
+    result = db.session.execute(
+        update(table)
+        .where(table.c.id == coupon_id)
+        .where(or_(table.c.max_uses.is_(None), table.c.max_uses == 0, table.c.times_used < table.c.max_uses))
+        .values(times_used=table.c.times_used + 1)
+    )
+    if result.rowcount != 1:
+        raise CouponExhaustedError()
+
+
+def reserve_stock(order, lines, ttl):
+    decrement_stock(lines)
+    expires_at = datetime.utcnow() + ttl
+    order.reservations = [
+        StockReservation(product_id=product_id, quantity=quantity, status=RESERVED, expires_at=expires_at)
+        for product_id, quantity in lines
+    ]
+
+
+def _transition(reservation_id, from_status, to_status):
+    table = StockReservation.__table__
+    result = db.session.execute(
+        update(table)
+        .where(table.c.id == reservation_id)
+        .where(table.c.status == from_status)
+        .values(status=to_status)
+    )
+    return result.rowcount == 1
+
+
+def _order_reservations(order_id):
+    table = StockReservation.__table__
+    return db.session.execute(
+        select(table.c.id, table.c.product_id, table.c.quantity, table.c.status)
+        .where(table.c.order_id == order_id)
+    ).all()
+
+
+def commit_order_reservations(order_id):
+    # Pagamento aprovado: a reserva vira baixa definitiva. Se a reserva já
+    # tinha expirado, tenta retirar o estoque de novo.
+    for row in _order_reservations(order_id):
+        if row.status == RESERVED:
+            _transition(row.id, RESERVED, COMMITTED)
+        elif row.status == RELEASED:
+            try:
+                decrement_stock([(row.product_id, row.quantity)])
+            except OutOfStockError:
+                logger.warning('Pedido %s confirmado sem estoque para o produto %s', order_id, row.product_id)
+                continue
+            _transition(row.id, RELEASED, COMMITTED)
+
+
+def release_order_reservations(order_id, include_committed=False):
+    statuses = (RESERVED, COMMITTED) if include_committed else (RESERVED,)
+    for row in _order_reservations(order_id):
+        if row.status in statuses and _transition(row.id, row.status, RELEASED):
+            increment_stock([(row.product_id, row.quantity)])
+
+
+def release_expired_reservations(batch_size=DEFAULT_SWEEP_BATCH, now=None):
+    # Cada lote é uma transação própria para não segurar o lock de escrita do SQLite
+    table = StockReservation.__table__
+    now = now or datetime.utcnow()
+    released = 0
+    while True:
+        rows = db.session.execute(
+            select(table.c.id, table.c.order_id, table.c.product_id, table.c.quantity)
+            .where(table.c.status == RESERVED)
+            .where(table.c.expires_at < now)
+            .order_by(table.c.expires_at)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        order_ids = set()
+        for row in rows:
+            if _transition(row.id, RESERVED, RELEASED):
+                increment_stock([(row.product_id, row.quantity)])
+                order_ids.add(row.order_id)
+                released += 1
+        if order_ids:
+            db.session.execute(
+                update(Order.__table__)
+                .where(Order.__table__.c.id.in_(order_ids))
+                .where(Order.__table__.c.status == 'Pendente')
+                .values(status='Cancelado', payment_status='Expirado')
+            )
+        db.session.commit()
+        if len(rows) < batch_size:
+            break
+    return released
+
+
+def _sweep(batch_size):
+    released = release_expired_reservations(batch_size)
+    if released:
+        logger.info('%s reservas de estoque expiradas devolvidas', released)
+    return released
+
+
+def init_reservations(app):
+    interval = app.config.get('RESERVATION_SWEEP_INTERVAL', 0)
+    if interval and not app.testing:
+        batch_size = app.config.get('RESERVATION_SWEEP_BATCH', DEFAULT_SWEEP_BATCH)
+        sweeper = PeriodicTask(app, interval, lambda: _sweep(batch_size), 'reservation-sweeper')
+        app.extensions['reservation_sweeper'] = sweeper
+        sweeper.start()
+
+
+reservations_cli = AppGroup('reservations', help='Reservas de estoque de pedidos não pagos.')
+
+
+@reservations_cli.command('sweep')
+@click.option('--batch-size', default=DEFAULT_SWEEP_BATCH, show_default=True)
+def sweep_command(batch_size):
+    released = release_expired_reservations(batch_size)
+    click.echo(f'{released} reserva(s) expirada(s) devolvida(s) ao estoque.')
@@ -0,0 +1,313 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select, update, delete, func, or_, and_, text
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models import PasswordResetToken, CartItem, Order, OrderItem, StockReservation, ArchivedOrder, MaintenanceJob
+from app.inventory import release_order_reservations
+from app.periodic import PeriodicTask
+import click
+import json
+import logging
+import os
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH = 500
+# Lotes por execução: uma rodada nunca processa mais que BATCH * MAX_BATCHES linhas
+DEFAULT_MAX_BATCHES = 20
+# Prazo da trava; uma execução que morrer no meio libera a tarefa depois disso
+LOCK_TTL = timedelta(minutes=15)
+# Tokens expirados ficam um dia para consulta antes de sair
+TOKEN_GRACE = timedelta(days=1)
+# Páginas devolvidas ao sistema por execução do incremental_vacuum
+VACUUM_PAGES = 2000
+# Pedidos com pagamento registrado nunca são arquivados
+PAID_PAYMENT_STATUSES = ('Aprovado', 'Reembolsado')
+
+_UPSERT_DIALECTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+Job = namedtuple('Job', ['name', 'interval', 'func'])
+JobResult = namedtuple('JobResult', ['name', 'result', 'duration_ms', 'error'])
+
+
+def _delete_in_batches(table, where, batch_size, max_batches):
+    # Cada lote é uma transação própria para não segurar o lock de escrita do SQLite
+    deleted = 0
+    for _ in range(max_batches):
+        ids = db.session.execute(select(table.c.id).where(where).limit(batch_size)).scalars().all()
+        if not ids:
+            break
+        db.session.execute(delete(table).where(table.c.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            break
+    return deleted
+
+
+def delete_expired_tokens(batch_size, max_batches, now):
+    # Token usado não vale mais nada e sai na hora; expirado espera TOKEN_GRACE
+    table = PasswordResetToken.__table__
+    where = or_(table.c.used.is_(True), table.c.expires_at < now - TOKEN_GRACE)
+    return _delete_in_batches(table, where, batch_size, max_batches)
+
+
+def delete_stale_carts(batch_size, max_batches, now):
+    # Carrinho abandonado: nenhum item adicionado nos últimos CART_TTL_DAYS dias.
+    # O carrinho inteiro do usuário sai de uma vez.
+    table = CartItem.__table__
+    cutoff = now - timedelta(days=current_app.config.get('CART_TTL_DAYS', 60))
+    deleted = 0
+    for _ in range(max_batches):
+        user_ids = db.session.execute(
+            select(table.c.user_id)
+            .where(table.c.created_at < cutoff)
+            .group_by(table.c.user_id)
+            .having(func.max(table.c.created_at) < cutoff)
+            .limit(batch_size)
+        ).scalars().all()
+        if not user_ids:
+            break
+        result = db.session.execute(delete(table).where(table.c.user_id.in_(user_ids)))
+        db.session.commit()
+        deleted += result.rowcount
+        if len(user_ids) < batch_size:
+            break
+    return deleted
+
+
+def _archivable_orders(cutoff):
+    # Pedidos nunca pagos: ainda pendentes ou cancelados pela expiração da reserva.
+    # Pedido pago que o admin voltou para "Pendente" perde o confirmed_at, mas
+    # o payment_status continua mostrando o pagamento e o mantém fora daqui.
+    table = Order.__table__
+    return and_(
+        or_(
+            table.c.status == 'Pendente',
+            and_(table.c.status == 'Cancelado', table.c.payment_status == 'Expirado'),
+        ),
+        or_(table.c.payment_status.is_(None), table.c.payment_status.notin_(PAID_PAYMENT_STATUSES)),
+        table.c.confirmed_at.is_(None),
+        table.c.created_at < cutoff,
+    )
+
+
+def archive_pending_orders(batch_size, max_batches, now):
+    orders = Order.__table__
+    items = OrderItem.__table__
+    reservations = StockReservation.__table__
+    cutoff = now - timedelta(days=current_app.config.get('ORDER_ARCHIVE_DAYS', 90))
+    archived = 0
+    for _ in range(max_batches):
+        rows = db.session.execute(
+            select(orders).where(_archivable_orders(cutoff)).order_by(orders.c.created_at).limit(batch_size)
+        ).mappings().all()
+        if not rows:
+            break
+        ids = [row['id'] for row in rows]
+        lines = {}
+        for item in db.session.execute(select(items).where(items.c.order_id.in_(ids))).mappings():
+            lines.setdefault(item['order_id'], []).append(dict(item))
+        for order_id in ids:
+            # Reserva ainda ativa (varredura desligada) volta para o estoque
+            release_order_reservations(order_id)
+        db.session.execute(ArchivedOrder.__table__.insert(), [
+            {
+                'id': row['id'],
+                'user_id': row['user_id'],
+                'status': row['status'],
+                'payment_status': row['payment_status'],
+                'total': row['total'],
+                'created_at': row['created_at'],
+                'archived_at': now,
+                'data': json.dumps({**dict(row), 'items': lines.get(row['id'], [])}, default=str, ensure_ascii=False),
+            }
+            for row in rows
+        ])
+        db.session.execute(delete(reservations).where(reservations.c.order_id.in_(ids)))
+        db.session.execute(delete(items).where(items.c.order_id.in_(ids)))
+        db.session.execute(delete(orders).where(orders.c.id.in_(ids)))
+        db.session.commit()
+        archived += len(ids)
+        if len(ids) < batch_size:
+            break
+    return archived
+
+
+def sqlite_optimize(batch_size, max_batches, now):
+    if db.engine.dialect.name != 'sqlite':
+        return 0
+    from app.database import optimize_database
+    optimize_database()
+    return 0
+
+
+def sqlite_incremental_vacuum(batch_size, max_batches, now):
+    # Só faz efeito com auto_vacuum=INCREMENTAL (flask maintenance enable-incremental-vacuum)
+    if db.engine.dialect.name != 'sqlite':
+        return 0
+    with db.engine.connect() as conn:
+        if conn.execute(text('PRAGMA auto_vacuum')).scalar() != 2:
+            return 0
+        before = conn.execute(text('PRAGMA freelist_count')).scalar()
+        # O sqlite3 do Python executa um único passo do PRAGMA, que libera uma
+        # página; por isso uma chamada por página, limitada a VACUUM_PAGES
+        for _ in range(min(before, VACUUM_PAGES)):
+            conn.exec_driver_sql('PRAGMA incremental_vacuum(1)')
+        conn.commit()
+        after = conn.execute(text('PRAGMA freelist_count')).scalar()
+    return before - after
+
+
+# Intervalo mínimo entre execuções de cada tarefa, em segundos
+JOBS = (
+    Job('expired_tokens', 3600, delete_expired_tokens),
+    Job('stale_carts', 6 * 3600, delete_stale_carts),
+    Job('archive_orders', 24 * 3600, archive_pending_orders),
+    Job('sqlite_optimize', 3600, sqlite_optimize),
+    Job('sqlite_vacuum', 24 * 3600, sqlite_incremental_vacuum),
+)
+
+
+def _owner():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _ensure_job_rows():
+    table = MaintenanceJob.__table__
+    existing = set(db.session.execute(select(table.c.name)).scalars())
+    missing = [{'name': job.name, 'runs': 0, 'total_duration_ms': 0} for job in JOBS if job.name not in existing]
+    if not missing:
+        return
+    dialect = db.engine.dialect.name
+    if dialect in _UPSERT_DIALECTS:
+        db.session.execute(_UPSERT_DIALECTS[dialect](table).on_conflict_do_nothing(), missing)
+    else:
+        db.session.execute(table.insert(), missing)
+    db.session.commit()
+
+
+def _acquire(job, owner, now, force):
+    # A trava e a checagem do intervalo vão no mesmo UPDATE condicional: com
+    # vários processos rodando o agendador, só um executa cada tarefa por vez
+    table = MaintenanceJob.__table__
+    stmt = (
+        update(table)
+        .where(table.c.name == job.name)
+        .where(or_(table.c.locked_until.is_(None), table.c.locked_until < now))
+    )
+    if not force:
+        stmt = stmt.where(or_(
+            table.c.last_finished_at.is_(None),
+            table.c.last_finished_at <= now - timedelta(seconds=job.interval),
+        ))
+    result = db.session.execute(stmt.values(locked_by=owner, locked_until=now + LOCK_TTL, last_started_at=now))
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def run_job(job, batch_size=DEFAULT_BATCH, max_batches=DEFAULT_MAX_BATCHES, force=False, owner=None):
+    owner = owner or _owner()
+    now = datetime.utcnow()
+    if not _acquire(job, owner, now, force):
+        return None
+    started = time.perf_counter()
+    result = error = None
+    try:
+        result = job.func(batch_size, max_batches, now)
+    except Exception as exc:
+        db.session.rollback()
+        error = str(exc)[:1000]
+        logger.exception('Falha na manutenção %s', job.name)
+    duration = int((time.perf_counter() - started) * 1000)
+    table = MaintenanceJob.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.name == job.name)
+        .where(table.c.locked_by == owner)
+        .values(
+            locked_by=None, locked_until=None, last_finished_at=datetime.utcnow(),
+            last_duration_ms=duration, last_result=result, last_error=error,
+            runs=table.c.runs + 1, total_duration_ms=table.c.total_duration_ms + duration,
+        )
+    )
+    db.session.commit()
+    if error is None:
+        logger.info('Manutenção %s: %s registro(s) em %sms', job.name, result, duration)
+    return JobResult(job.name, result, duration, error)
+
+
+def run_due_jobs(names=None, force=False, batch_size=DEFAULT_BATCH, max_batches=DEFAULT_MAX_BATCHES):
+    _ensure_job_rows()
+    results = []
+    for job in JOBS:
+        if names and job.name not in names:
+            continue
+        result = run_job(job, batch_size, max_batches, force)
+        if result:
+            results.append(result)
+    return results
+
+
+def init_maintenance(app):
+    # Todos os workers rodam o agendador; a trava de cada tarefa elege quem executa.
+    # MAINTENANCE_INTERVAL=0 desliga e deixa a manutenção para o cron (flask maintenance run).
+    interval = app.config.get('MAINTENANCE_INTERVAL', 0)
+    if interval and not app.testing:
+        batch_size = app.config.get('MAINTENANCE_BATCH', DEFAULT_BATCH)
+        task = PeriodicTask(app, interval, lambda: run_due_jobs(batch_size=batch_size), 'maintenance')
+        app.extensions['maintenance'] = task
+        task.start()
+
+
+maintenance_cli = AppGroup('maintenance', help='Limpeza periódica de tabelas e do banco.')
+
+
+@maintenance_cli.command('run')
+@click.option('--job', 'names', multiple=True, type=click.Choice([job.name for job in JOBS]))
+@click.option('--force', is_flag=True, help='Ignora o intervalo mínimo entre execuções.')
+@click.option('--batch-size', default=DEFAULT_BATCH, show_default=True)
+@click.option('--max-batches', default=DEFAULT_MAX_BATCHES, show_default=True)
+def run_command(names, force, batch_size, max_batches):
+    results = run_due_jobs(names, force, batch_size, max_batches)
+    for result in results:
+        status = f'ERRO: {result.error}' if result.error else f'{result.result} registro(s)'
+        click.echo(f'{result.name}: {status} em {result.duration_ms}ms')
+    if not results:
+        click.echo('Nenhuma tarefa pendente (ou todas travadas por outro processo).')
+
+
+@maintenance_cli.command('status')
+def status_command():
+    _ensure_job_rows()
+    for row in MaintenanceJob.query.order_by(MaintenanceJob.name):
+        average = row.total_duration_ms // row.runs if row.runs else 0
+        lock = f' [travada por {row.locked_by}]' if row.locked_until and row.locked_until > datetime.utcnow() else ''
+        click.echo(
+            f'{row.name}: {row.runs} execução(ões), última em {row.last_finished_at or "-"} '
+            f'({row.last_result if row.last_result is not None else "-"} registro(s), {row.last_duration_ms or 0}ms; '
+            f'média {average}ms){lock}'
+        )
+        if row.last_error:
+            click.echo(f'    erro: {row.last_error}')
+
+
+@maintenance_cli.command('enable-incremental-vacuum')
+def enable_incremental_vacuum_command():
+    # VACUUM reescreve o arquivo inteiro: rodar com a loja parada
+    if db.engine.dialect.name != 'sqlite':
+        raise click.ClickException('Disponível apenas para SQLite.')
+    with db.engine.connect() as conn:
+        conn.execute(text('PRAGMA auto_vacuum=INCREMENTAL'))
+        conn.commit()
+        conn.execution_options(isolation_level='AUTOCOMMIT').execute(text('VACUUM'))
+        mode = conn.execute(text('PRAGMA auto_vacuum')).scalar()
+    click.echo(f'auto_vacuum={mode} (2 = INCREMENTAL).')
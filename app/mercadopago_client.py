@@ -0,0 +1,126 @@
+from collections import namedtuple
+import bisect
+import os
+import threading
+import time
+
+try:
+    import mercadopago
+    import requests
+    from mercadopago.http import HttpClient
+    from requests.adapters import HTTPAdapter
+    from urllib3.util import Retry
+except ImportError:
+    mercadopago = None
+    HttpClient = object
+
+API_BASE_URL = 'https://api.mercadopago.com'
+
+# Limites em segundos para conectar e para esperar a resposta; o padrão do
+# SDK (60s) prende o worker do gunicorn por um minuto se a API travar
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+POOL_SIZE = 10
+
+# Limites superiores dos baldes do histograma, em milissegundos
+LATENCY_BUCKETS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+LatencySnapshot = namedtuple('LatencySnapshot', ['count', 'total_ms', 'max_ms', 'buckets'])
+
+_sdk = None
+_sdk_lock = threading.Lock()
+_fake_sdk = None
+
+
+class PooledHttpClient(HttpClient):
+    # Uma sessão requests por processo: conexões keep-alive reaproveitadas
+    # entre chamadas, em vez de um handshake TLS novo a cada requisição
+    def __init__(self, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), pool_size=POOL_SIZE, base_url=None):
+        self.timeout = timeout
+        self.base_url = base_url.rstrip('/') if base_url else None
+        # Só repete falhas de conexão (a requisição nem saiu); um POST que
+        # chegou à API não é reenviado para não criar preferências duplicadas
+        retry = Retry(total=1, connect=1, read=0, status=0, redirect=0)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, url, maxretries=None, **kwargs):
+        kwargs.pop('retry_on', None)
+        kwargs.pop('backoff_factor', None)
+        kwargs['timeout'] = self.timeout
+        if self.base_url and url.startswith(API_BASE_URL):
+            url = self.base_url + url[len(API_BASE_URL):]
+        result = self.session.request(method, url, **kwargs)
+        response = {'status': result.status_code, 'response': None}
+        if result.status_code != 204 and result.content:
+            try:
+                response['response'] = result.json()
+            except ValueError:
+                response['response'] = {'message': 'invalid JSON response'}
+        return response
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def observe(self, operation, seconds):
+        ms = seconds * 1000
+        with self._lock:
+            count, total, peak, counts = self._data.get(operation) or (0, 0.0, 0.0, [0] * (len(self.buckets) + 1))
+            counts[bisect.bisect_left(self.buckets, ms)] += 1
+            self._data[operation] = (count + 1, total + ms, max(peak, ms), counts)
+
+    def snapshot(self):
+        with self._lock:
+            labels = [f'<={bound}ms' for bound in self.buckets] + [f'>{self.buckets[-1]}ms']
+            return {
+                operation: LatencySnapshot(count, round(total, 1), round(peak, 1), dict(zip(labels, counts)))._asdict()
+                for operation, (count, total, peak, counts) in self._data.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._data.clear()
+
+
+provider_latency = LatencyHistogram()
+
+
+def provider_call(operation, func, *args):
+    started = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        provider_latency.observe(operation, time.perf_counter() - started)
+
+
+def get_mp_sdk():
+    global _sdk, _fake_sdk
+    if os.getenv('MERCADOPAGO_FAKE') == '1':
+        # Uma instância por processo: webhook e worker enxergam os mesmos pagamentos
+        if _fake_sdk is None:
+            from app.fake_mercadopago import FakeSDK
+            _fake_sdk = FakeSDK(latency=float(os.getenv('MERCADOPAGO_FAKE_LATENCY', 0)))
+        return _fake_sdk
+    access_token = os.getenv('MERCADOPAGO_ACCESS_TOKEN')
+    if not access_token or mercadopago is None:
+        return None
+    # Criado uma vez por processo (e de novo só se o token mudar)
+    with _sdk_lock:
+        if _sdk is None or _sdk[0] != access_token:
+            http_client = PooledHttpClient(
+                timeout=(
+                    float(os.getenv('MERCADOPAGO_CONNECT_TIMEOUT', CONNECT_TIMEOUT)),
+                    float(os.getenv('MERCADOPAGO_READ_TIMEOUT', READ_TIMEOUT)),
+                ),
+                pool_size=int(os.getenv('MERCADOPAGO_POOL_SIZE', POOL_SIZE)),
+                # MERCADOPAGO_API_BASE aponta para o dublê local (flask payments fake-provider)
+                base_url=os.getenv('MERCADOPAGO_API_BASE'),
+            )
+            _sdk = (access_token, mercadopago.SDK(access_token, http_client=http_client))
+        return _sdk[1]
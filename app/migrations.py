@@ -0,0 +1,206 @@
+from collections import namedtuple
+from datetime import datetime
+from flask.cli import AppGroup
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, select, text, inspect
+import click
+import logging
+
+logger = logging.getLogger(__name__)
+
+Migration = namedtuple('Migration', ['version', 'name', 'upgrade'])
+
+# Tabela de controle fora do metadata dos modelos: o create_all não mexe nela
+_metadata = MetaData()
+schema_migration = Table(
+    'schema_migration', _metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def _create_model_indexes(conn, *models):
+    # Os índices são declarados nos modelos; bancos novos já os recebem no create_all.
+    # Índices sobre colunas que uma migração posterior ainda vai criar ficam para ela.
+    for model in models:
+        existing = {c['name'] for c in inspect(conn).get_columns(model.__table__.name)}
+        for index in model.__table__.indexes:
+            if all(column.name in existing for column in index.columns):
+                index.create(conn, checkfirst=True)
+
+
+def _m001_indexes(conn):
+    from app.models import Product, Order, OrderItem, CartItem, Wishlist, Review, Coupon, StockReservation
+
+    # Duplicatas antigas impediriam os índices únicos: o carrinho soma as
+    # quantidades na linha mais antiga; favoritos e avaliações mantêm uma linha.
+    conn.execute(text(
+        'UPDATE cart_item SET quantity = ('
+        ' SELECT SUM(c2.quantity) FROM cart_item c2'
+        ' WHERE c2.user_id = cart_item.user_id AND c2.product_id = cart_item.product_id'
+        ') WHERE id IN ('
+        ' SELECT MIN(id) FROM cart_item GROUP BY user_id, product_id HAVING COUNT(*) > 1'
+        ')'
+    ))
+    conn.execute(text(
+        'DELETE FROM cart_item WHERE id NOT IN (SELECT MIN(id) FROM cart_item GROUP BY user_id, product_id)'
+    ))
+    conn.execute(text(
+        'DELETE FROM wishlist WHERE id NOT IN (SELECT MIN(id) FROM wishlist GROUP BY user_id, product_id)'
+    ))
+    conn.execute(text(
+        'DELETE FROM review WHERE id NOT IN (SELECT MAX(id) FROM review GROUP BY user_id, product_id)'
+    ))
+
+    _create_model_indexes(conn, Product, Order, OrderItem, CartItem, Wishlist, Review, Coupon, StockReservation)
+
+
+def _add_column(conn, model, name):
+    table = model.__table__
+    if name in {c['name'] for c in inspect(conn).get_columns(table.name)}:
+        return False
+    column_type = table.c[name].type.compile(dialect=conn.dialect)
+    table_name = conn.dialect.identifier_preparer.format_table(table)
+    conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {name} {column_type}'))
+    return True
+
+
+def _m002_updated_at(conn):
+    from app.models import Product, Category
+    for model in (Product, Category):
+        _add_column(conn, model, 'updated_at')
+        table = model.__table__
+        conn.execute(
+            table.update().where(table.c.updated_at.is_(None)).values(
+                updated_at=text('COALESCE(created_at, CURRENT_TIMESTAMP)')
+            )
+        )
+
+
+def _m003_sales_rollups(conn):
+    from app.models import Order, DailySales, ProductDailySales
+    from app.sales import SOLD_STATUSES, rebuild_sales
+    _add_column(conn, Order, 'confirmed_at')
+    for model in (DailySales, ProductDailySales):
+        model.__table__.create(conn, checkfirst=True)
+    # Pedidos antigos não têm a data da confirmação: usa a data do pedido
+    table = Order.__table__
+    conn.execute(
+        table.update()
+        .where(table.c.confirmed_at.is_(None))
+        .where(table.c.status.in_(SOLD_STATUSES))
+        .values(confirmed_at=table.c.created_at)
+    )
+    rebuild_sales(conn)
+
+
+def _m004_ratings(conn):
+    from app.models import Product
+    from app.ratings import rebuild_ratings
+    for name in ('rating_count', 'rating_sum', 'rating_avg', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5'):
+        _add_column(conn, Product, name)
+    rebuild_ratings(conn)
+    _create_model_indexes(conn, Product)
+
+
+def _m005_payment_notifications(conn):
+    from app.models import PaymentNotification
+    PaymentNotification.__table__.create(conn, checkfirst=True)
+
+
+def _m006_order_preference(conn):
+    from app.models import Order
+    for name in ('preference_id', 'preference_url', 'preference_key', 'preference_expires_at'):
+        _add_column(conn, Order, name)
+
+
+def _m007_maintenance(conn):
+    from app.models import ArchivedOrder, MaintenanceJob, PasswordResetToken, CartItem
+    for model in (ArchivedOrder, MaintenanceJob):
+        model.__table__.create(conn, checkfirst=True)
+    _create_model_indexes(conn, PasswordResetToken, CartItem)
+
+
+MIGRATIONS = (
+    Migration(1, 'índices de chaves estrangeiras e filtros', _m001_indexes),
+    Migration(2, 'updated_at em produtos e categorias', _m002_updated_at),
+    Migration(3, 'estatísticas de vendas diárias', _m003_sales_rollups),
+    Migration(4, 'agregado de avaliações por produto', _m004_ratings),
+    Migration(5, 'fila de notificações do Mercado Pago', _m005_payment_notifications),
+    Migration(6, 'preferência de pagamento por pedido', _m006_order_preference),
+    Migration(7, 'tarefas de manutenção e pedidos arquivados', _m007_maintenance),
+)
+
+
+def applied_versions(engine):
+    schema_migration.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        return set(conn.execute(select(schema_migration.c.version)).scalars())
+
+
+def pending_migrations(engine):
+    applied = applied_versions(engine)
+    return [m for m in MIGRATIONS if m.version not in applied]
+
+
+def upgrade(engine=None):
+    from app import db
+    engine = engine or db.engine
+    applied = []
+    for migration in pending_migrations(engine):
+        # Migração e registro da versão na mesma transação. As migrações são
+        # idempotentes, então dois processos subindo juntos não quebram nada.
+        with engine.begin() as conn:
+            migration.upgrade(conn)
+            conn.execute(
+                schema_migration.insert().from_select(
+                    ['version', 'name', 'applied_at'],
+                    select(
+                        text(':version'), text(':name'), text(':applied_at')
+                    ).where(
+                        ~select(schema_migration.c.version)
+                        .where(schema_migration.c.version == migration.version)
+                        .exists()
+                    )
+                ),
+                {'version': migration.version, 'name': migration.name, 'applied_at': datetime.utcnow()}
+            )
+        logger.info('Migração %03d aplicada: %s', migration.version, migration.name)
+        applied.append(migration)
+    return applied
+
+
+db_cli = AppGroup('db', help='Migrações do esquema e verificação de planos de consulta.')
+
+
+@db_cli.command('upgrade')
+def upgrade_command():
+    applied = upgrade()
+    for migration in applied:
+        click.echo(f'{migration.version:03d} {migration.name}')
+    click.echo(f'{len(applied)} migração(ões) aplicada(s).')
+
+
+@db_cli.command('status')
+def status_command():
+    from app import db
+    applied = applied_versions(db.engine)
+    for migration in MIGRATIONS:
+        mark = 'x' if migration.version in applied else ' '
+        click.echo(f'[{mark}] {migration.version:03d} {migration.name}')
+
+
+@db_cli.command('check-plans')
+@click.option('--verbose', is_flag=True, help='Mostra o plano completo de cada consulta.')
+def check_plans_command(verbose):
+    from app.query_plans import check_query_plans
+    failures = 0
+    for result in check_query_plans():
+        status = 'OK ' if result.ok else 'FALHA'
+        click.echo(f'{status} {result.name}')
+        if verbose or not result.ok:
+            for line in result.plan:
+                click.echo(f'      {line}')
+        failures += not result.ok
+    if failures:
+        raise click.ClickException(f'{failures} consulta(s) com varredura completa de tabela.')
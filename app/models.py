@@ -1,6 +1,6 @@
 from app import db
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.passwords import hash_password, verify_password, needs_rehash
 from datetime import datetime, timedelta
 import secrets
 
@@ -19,10 +19,14 @@ class User(UserMixin, db.Model):
     reviews = db.relationship('Review', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        # Hash gerado com parâmetros diferentes dos configurados (PASSWORD_HASH_METHOD)
+        return needs_rehash(self.password_hash)
 
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -30,6 +34,7 @@ class Category(db.Model):
     description = db.Column(db.Text)
     image_url = db.Column(db.String(500))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     products = db.relationship('Product', backref='category', lazy=True)
 
@@ -49,6 +54,34 @@ class Product(db.Model):
     featured = db.Column(db.Boolean, default=False)
     active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Agregado das avaliações, mantido por app/ratings.py
+    rating_count = db.Column(db.Integer, default=0)
+    rating_sum = db.Column(db.Integer, default=0)
+    rating_avg = db.Column(db.Float, default=0)
+    rating_1 = db.Column(db.Integer, default=0)
+    rating_2 = db.Column(db.Integer, default=0)
+    rating_3 = db.Column(db.Integer, default=0)
+    rating_4 = db.Column(db.Integer, default=0)
+    rating_5 = db.Column(db.Integer, default=0)
+    
+    __table_args__ = (
+        db.Index('ix_product_category_active_name', 'category_id', 'active', 'name', 'id'),
+        db.Index('ix_product_category_active_rating', 'category_id', 'active', 'rating_avg', 'id'),
+        db.Index('ix_product_featured_active', 'featured', 'active'),
+        db.Index('ix_product_name', 'name', 'id'),
+        db.Index('ix_product_stock', 'stock'),
+    )
+    
+    @property
+    def rating_histogram(self):
+        # [(estrelas, quantidade, % do total)] de 5 a 1
+        total = self.rating_count or 0
+        return [
+            (stars, getattr(self, f'rating_{stars}') or 0,
+             round(100 * (getattr(self, f'rating_{stars}') or 0) / total) if total else 0)
+            for stars in range(5, 0, -1)
+        ]
     
     def get_all_images(self):
         images = []
@@ -74,8 +107,22 @@ class Order(db.Model):
     customer_phone = db.Column(db.String(50))
     shipping_cost = db.Column(db.Float, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Preenchido quando o pedido entra nas estatísticas de vendas (app/sales.py)
+    confirmed_at = db.Column(db.DateTime)
+    # Última preferência criada no Mercado Pago, reaproveitada enquanto válida
+    preference_id = db.Column(db.String(100))
+    preference_url = db.Column(db.String(500))
+    preference_key = db.Column(db.String(64))
+    preference_expires_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_order_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_order_status', 'status'),
+        db.Index('ix_order_created', 'created_at', 'id'),
+    )
     
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
+    reservations = db.relationship('StockReservation', backref='order', lazy=True, cascade='all, delete-orphan')
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -84,8 +131,92 @@ class OrderItem(db.Model):
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
     
+    __table_args__ = (
+        db.Index('ix_order_item_order', 'order_id'),
+        db.Index('ix_order_item_product', 'product_id'),
+    )
+    
     product = db.relationship('Product')
 
+class DailySales(db.Model):
+    # Acumulado de vendas por dia de confirmação; mantido por app/sales.py
+    day = db.Column(db.Date, primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    items = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+class ProductDailySales(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.Index('ix_product_daily_sales_product', 'product_id'),
+    )
+
+class StockReservation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), default='reserved', nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_stock_reservation_status_expires', 'status', 'expires_at'),
+        db.Index('ix_stock_reservation_order', 'order_id'),
+    )
+
+class PaymentNotification(db.Model):
+    # Fila de notificações do Mercado Pago; uma linha por (topic, resource_id)
+    id = db.Column(db.Integer, primary_key=True)
+    topic = db.Column(db.String(30), nullable=False)
+    resource_id = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), default='pending', nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    received_at = db.Column(db.DateTime, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, nullable=False)
+    processed_at = db.Column(db.DateTime)
+    applied_status = db.Column(db.String(30))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('uq_payment_notification_topic_resource', 'topic', 'resource_id', unique=True),
+        db.Index('ix_payment_notification_status_next', 'status', 'next_attempt_at'),
+    )
+
+class ArchivedOrder(db.Model):
+    # Pedidos não pagos antigos retirados de order/order_item (app/maintenance.py);
+    # data guarda o pedido e os itens em JSON
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(50))
+    payment_status = db.Column(db.String(50))
+    total = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False)
+    data = db.Column(db.Text, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_archived_order_user', 'user_id'),
+    )
+
+class MaintenanceJob(db.Model):
+    # Estado de cada tarefa de manutenção: trava entre processos e métricas da última execução
+    name = db.Column(db.String(50), primary_key=True)
+    locked_by = db.Column(db.String(100))
+    locked_until = db.Column(db.DateTime)
+    last_started_at = db.Column(db.DateTime)
+    last_finished_at = db.Column(db.DateTime)
+    last_duration_ms = db.Column(db.Integer)
+    last_result = db.Column(db.Integer)
+    last_error = db.Column(db.Text)
+    runs = db.Column(db.Integer, default=0, nullable=False)
+    total_duration_ms = db.Column(db.Integer, default=0, nullable=False)
+
 class CartItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -93,6 +224,11 @@ class CartItem(db.Model):
     quantity = db.Column(db.Integer, nullable=False, default=1)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('uq_cart_item_user_product', 'user_id', 'product_id', unique=True),
+        db.Index('ix_cart_item_created', 'created_at'),
+    )
+    
     product = db.relationship('Product')
     user = db.relationship('User')
 
@@ -109,6 +245,10 @@ class Coupon(db.Model):
     active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_coupon_created', 'created_at', 'id'),
+    )
+    
     def is_valid(self):
         if not self.active:
             return False, "Cupom inativo"
@@ -137,6 +277,10 @@ class Wishlist(db.Model):
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('uq_wishlist_user_product', 'user_id', 'product_id', unique=True),
+    )
+    
     product = db.relationship('Product')
 
 class Review(db.Model):
@@ -148,6 +292,11 @@ class Review(db.Model):
     verified_purchase = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('uq_review_user_product', 'user_id', 'product_id', unique=True),
+        db.Index('ix_review_product_created', 'product_id', 'created_at'),
+    )
+    
     product = db.relationship('Product')
 
 class PasswordResetToken(db.Model):
@@ -158,6 +307,10 @@ class PasswordResetToken(db.Model):
     used = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_password_reset_token_expires', 'expires_at'),
+    )
+    
     user = db.relationship('User')
     
     @staticmethod
@@ -173,6 +326,20 @@ class StoreSettings(db.Model):
     setting_value = db.Column(db.Text)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Linha reservada trocada a cada gravação, na mesma transação: os outros
+    # workers comparam com a versão do snapshot e recarregam (app/settings.py)
+    VERSION_KEY = '_version'
+    
+    @staticmethod
+    def _bump_version(now):
+        setting = StoreSettings.query.filter_by(setting_key=StoreSettings.VERSION_KEY).first()
+        version = secrets.token_hex(8)
+        if setting:
+            setting.setting_value = version
+            setting.updated_at = now
+        else:
+            db.session.add(StoreSettings(setting_key=StoreSettings.VERSION_KEY, setting_value=version))
+    
     @staticmethod
     def get_setting(key, default=None):
         setting = StoreSettings.query.filter_by(setting_key=key).first()
@@ -187,8 +354,30 @@ class StoreSettings(db.Model):
         else:
             setting = StoreSettings(setting_key=key, setting_value=value)
             db.session.add(setting)
+        StoreSettings._bump_version(datetime.utcnow())
         db.session.commit()
+        from app.settings import settings_cache
+        settings_cache.invalidate()
         return setting
+    
+    @staticmethod
+    def set_many(values):
+        existing = {
+            s.setting_key: s
+            for s in StoreSettings.query.filter(StoreSettings.setting_key.in_(list(values))).all()
+        }
+        now = datetime.utcnow()
+        for key, value in values.items():
+            setting = existing.get(key)
+            if setting:
+                setting.setting_value = value
+                setting.updated_at = now
+            else:
+                db.session.add(StoreSettings(setting_key=key, setting_value=value))
+        StoreSettings._bump_version(now)
+        db.session.commit()
+        from app.settings import settings_cache
+        settings_cache.invalidate()
 
 class Slide(db.Model):
     id = db.Column(db.Integer, primary_key=True)
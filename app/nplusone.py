@@ -0,0 +1,62 @@
+from collections import Counter
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Quantas cargas lazy idênticas por requisição são toleradas antes de acusar N+1
+DEFAULT_THRESHOLD = 1
+
+
+class NPlusOneError(RuntimeError):
+    pass
+
+
+def _mode():
+    mode = current_app.config.get('NPLUSONE_DETECTION')
+    if mode is None:
+        mode = 'raise' if current_app.testing else 'off'
+    return mode
+
+
+def _track_lazy_load(orm_execute_state):
+    if not has_request_context() or not orm_execute_state.is_select:
+        return
+    if not orm_execute_state.is_relationship_load or orm_execute_state.lazy_loaded_from is None:
+        return
+    if _mode() == 'off':
+        return
+    counts = g.setdefault('_lazy_loads', Counter())
+    path = orm_execute_state.loader_strategy_path
+    counts[str(path) if path is not None else str(orm_execute_state.statement)] += 1
+
+
+def find_repeated_lazy_loads():
+    threshold = current_app.config.get('NPLUSONE_THRESHOLD', DEFAULT_THRESHOLD)
+    counts = g.get('_lazy_loads') or {}
+    return {key: n for key, n in counts.items() if n > threshold}
+
+
+def init_nplusone(app):
+    if not event.contains(Session, 'do_orm_execute', _track_lazy_load):
+        event.listen(Session, 'do_orm_execute', _track_lazy_load)
+
+    @app.before_request
+    def reset_lazy_loads():
+        g._lazy_loads = Counter()
+
+    @app.after_request
+    def check_lazy_loads(response):
+        if _mode() == 'off':
+            return response
+        repeated = find_repeated_lazy_loads()
+        if not repeated:
+            return response
+        summary = '; '.join(f'{n}x {key}' for key, n in repeated.items())
+        message = f'N+1 em {request.endpoint}: {summary}'
+        if _mode() == 'raise':
+            raise NPlusOneError(message)
+        logger.warning(message)
+        return response
@@ -0,0 +1,149 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from app.models import Order, OrderItem, Product, User
+import csv
+import io
+import json
+
+EXPORT_BATCH = 1000
+# Quantidade de linhas acumuladas antes de enviar um pedaço da resposta
+CHUNK_ROWS = 500
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+ORDER_COLUMNS = (
+    ('order_id', Order.id),
+    ('created_at', Order.created_at),
+    ('status', Order.status),
+    ('payment_status', Order.payment_status),
+    ('payment_id', Order.payment_id),
+    ('total', Order.total),
+    ('shipping_cost', Order.shipping_cost),
+    ('delivery_type', Order.delivery_type),
+    ('delivery_address', Order.delivery_address),
+    ('customer_name', Order.customer_name),
+    ('customer_phone', Order.customer_phone),
+    ('user_id', User.id),
+    ('username', User.username),
+    ('email', User.email),
+    ('cpf', User.cpf),
+    ('phone', User.phone),
+)
+ITEM_COLUMNS = (
+    ('item_id', OrderItem.id),
+    ('product_id', OrderItem.product_id),
+    ('product_code', Product.code),
+    ('product_name', Product.name),
+    ('quantity', OrderItem.quantity),
+    ('unit_price', OrderItem.price),
+)
+COLUMNS = ORDER_COLUMNS + ITEM_COLUMNS
+HEADER = [name for name, _ in COLUMNS]
+_ORDER_FIELDS = len(ORDER_COLUMNS)
+
+
+def parse_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f'Data inválida "{value}" (use AAAA-MM-DD).')
+
+
+def export_query(start=None, end=None, status=None):
+    # Uma linha por item; pedidos sem itens saem com as colunas do item vazias.
+    # Ordenado por ix_order_created: as linhas de um pedido ficam consecutivas.
+    query = (
+        select(*[column.label(name) for name, column in COLUMNS])
+        .select_from(Order)
+        .join(User, User.id == Order.user_id)
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+        .outerjoin(Product, Product.id == OrderItem.product_id)
+        .order_by(Order.created_at, Order.id, OrderItem.id)
+    )
+    if start:
+        query = query.where(Order.created_at >= start)
+    if end:
+        # Data final inclusiva
+        query = query.where(Order.created_at < end + timedelta(days=1))
+    if status:
+        query = query.where(Order.status == status)
+    return query
+
+
+def _stream_rows(engine, query):
+    # Conexão própria com cursor no servidor: só um lote fica em memória
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_BATCH).execute(query)
+        for partition in result.partitions():
+            yield from partition
+
+
+def _format(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ', timespec='seconds')
+    return value
+
+
+# Início de célula que o Excel/LibreOffice interpreta como fórmula
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_cell(value):
+    # Nome, endereço, usuário e e-mail vêm do cliente: um "=HYPERLINK(...)"
+    # viraria fórmula na planilha da contabilidade. O apóstrofo força texto.
+    if value is None:
+        return ''
+    value = _format(value)
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_csv(engine, query):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM para o Excel abrir os acentos corretamente
+    buffer.write('\ufeff')
+    writer.writerow(HEADER)
+    for count, row in enumerate(_stream_rows(engine, query), start=1):
+        writer.writerow([_csv_cell(value) for value in row])
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(engine, query):
+    # Um objeto por pedido com a lista de itens
+    order_names = HEADER[:_ORDER_FIELDS]
+    item_names = HEADER[_ORDER_FIELDS:]
+    lines = []
+    current = None
+    for row in _stream_rows(engine, query):
+        if current is None or current['order_id'] != row[0]:
+            if current is not None:
+                lines.append(json.dumps(current, ensure_ascii=False))
+                if len(lines) >= CHUNK_ROWS:
+                    yield '\n'.join(lines) + '\n'
+                    lines = []
+            current = {name: _format(value) for name, value in zip(order_names, row)}
+            current['items'] = []
+        if row[_ORDER_FIELDS] is not None:
+            current['items'].append(dict(zip(item_names, row[_ORDER_FIELDS:])))
+    if current is not None:
+        lines.append(json.dumps(current, ensure_ascii=False))
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def export_orders(engine, fmt, start=None, end=None, status=None):
+    query = export_query(start, end, status)
+    if fmt == 'ndjson':
+        return iter_ndjson(engine, query)
+    return iter_csv(engine, query)
@@ -0,0 +1,396 @@
+from collections import OrderedDict, namedtuple
+from flask import request, session, g, current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app.http_cache import is_shared_request, template_version
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Resposta guardada + versões das tags de que ela depende no momento do armazenamento
+PageEntry = namedtuple('PageEntry', ['stored_at', 'deps', 'status', 'headers', 'body'])
+
+# Toda página depende do layout (menu de categorias)
+LAYOUT_TAG = 'layout'
+
+# Endpoints cacheáveis e as tags de que dependem (além de LAYOUT_TAG)
+CACHEABLE_ENDPOINTS = {
+    'main.index': lambda args: ['home'],
+    'main.product_detail': lambda args: [f"product:{args['product_id']}"],
+    'main.category_products': lambda args: [f"category:{args['category_id']}"],
+    'main.search': lambda args: ['search'],
+}
+
+_SKIPPED_HEADERS = {'set-cookie', 'content-length'}
+
+
+def _atomic_write(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+class TagStore:
+    # Versões das tags em arquivos, um por tag: compartilhadas entre workers,
+    # então uma alteração feita em um processo invalida as páginas de todos
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, tag):
+        return os.path.join(self.directory, hashlib.sha1(tag.encode('utf-8')).hexdigest())
+
+    def versions(self, tags):
+        result = {}
+        for tag in tags:
+            try:
+                with open(self._path(tag), 'r') as f:
+                    result[tag] = f.read()
+            except FileNotFoundError:
+                result[tag] = ''
+        return result
+
+    def bump(self, tags):
+        for tag in tags:
+            _atomic_write(self._path(tag), uuid.uuid4().hex.encode('ascii'))
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+
+class MemoryBackend:
+    # LRU por processo limitado em bytes. Só os corpos ficam no processo;
+    # as versões das tags vêm do TagStore compartilhado
+    name = 'memory'
+
+    def __init__(self, max_bytes, tags):
+        self.max_bytes = max_bytes
+        self.tags = tags
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        size = len(entry.body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+
+    def delete(self, key):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+
+    def versions(self, tags):
+        return self.tags.versions(tags)
+
+    def bump(self, tags):
+        self.tags.bump(tags)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        self.tags.clear()
+
+    def size(self):
+        return len(self._entries), self._bytes
+
+
+class DiskBackend:
+    # Compartilhado entre workers: um arquivo por página e um arquivo por tag.
+    # Gravações atômicas (arquivo temporário + os.replace).
+    name = 'disk'
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.tags = TagStore(os.path.join(directory, 'tags'))
+        self._pages = os.path.join(directory, 'pages')
+        os.makedirs(self._pages, exist_ok=True)
+        self._writes = 0
+
+    def _page_path(self, key):
+        return os.path.join(self._pages, key)
+
+    def get(self, key):
+        try:
+            with open(self._page_path(key), 'rb') as f:
+                return PageEntry(*pickle.load(f))
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.warning('Entrada inválida no cache de páginas: %s', key)
+            self.delete(key)
+            return None
+
+    def set(self, key, entry):
+        if len(entry.body) > self.max_bytes:
+            return
+        _atomic_write(self._page_path(key), pickle.dumps(tuple(entry), protocol=pickle.HIGHEST_PROTOCOL))
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.prune()
+
+    def delete(self, key):
+        try:
+            os.unlink(self._page_path(key))
+        except FileNotFoundError:
+            pass
+
+    def versions(self, tags):
+        return self.tags.versions(tags)
+
+    def bump(self, tags):
+        self.tags.bump(tags)
+
+    def _files(self):
+        files = []
+        for name in os.listdir(self._pages):
+            try:
+                stat = os.stat(os.path.join(self._pages, name))
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, name))
+        return files
+
+    def prune(self):
+        # Remove as páginas mais antigas até caber no limite
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        for _, size, name in files:
+            if total <= self.max_bytes:
+                break
+            self.delete(name)
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self._pages):
+            try:
+                os.unlink(os.path.join(self._pages, name))
+            except FileNotFoundError:
+                pass
+        self.tags.clear()
+
+    def size(self):
+        files = self._files()
+        return len(files), sum(size for _, size, _ in files)
+
+
+class PageCache:
+    def __init__(self):
+        self.backend = None
+        self.ttl = 60
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def key(self):
+        args = sorted(request.args.items(multi=True))
+        raw = repr((template_version(), request.path, args))
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def lookup(self, key):
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry.stored_at > self.ttl:
+            self.backend.delete(key)
+            return None
+        # Inclui as tags declaradas pela view (ex.: categoria do produto)
+        current = self.backend.versions(entry.deps)
+        if any(current[tag] != version for tag, version in entry.deps.items()):
+            self.backend.delete(key)
+            return None
+        return entry
+
+    def versions(self, tags):
+        return self.backend.versions(tags)
+
+    def store(self, key, deps, response):
+        headers = [(k, v) for k, v in response.headers.items() if k.lower() not in _SKIPPED_HEADERS]
+        entry = PageEntry(time.time(), deps, response.status_code, headers, response.get_data())
+        self.backend.set(key, entry)
+        self.stores += 1
+
+    def invalidate(self, tags):
+        if self.enabled and tags:
+            self.backend.bump(tags)
+
+    def clear(self):
+        if self.enabled:
+            self.backend.clear()
+
+    def stats(self):
+        if not self.enabled:
+            return {'backend': None}
+        entries, size = self.backend.size()
+        requests = self.hits + self.misses
+        return {
+            'backend': self.backend.name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'hit_rate': round(self.hits / requests, 4) if requests else None,
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.backend.max_bytes,
+            'ttl': self.ttl,
+        }
+
+
+page_cache = PageCache()
+
+
+def cache_tags(*tags):
+    # Chamado pela view para declarar dependências conhecidas só após a consulta.
+    # As versões são lidas antes de renderizar: uma invalidação concorrente vence.
+    deps = g.get('page_cache_deps')
+    if deps is not None:
+        deps.update(page_cache.versions(tags))
+
+
+def _request_tags():
+    factory = CACHEABLE_ENDPOINTS.get(request.endpoint)
+    if factory is None:
+        return None
+    return [LAYOUT_TAG] + factory(request.view_args or {})
+
+
+def _serve_cached():
+    if request.method != 'GET' or not is_shared_request():
+        return None
+    tags = _request_tags()
+    if tags is None:
+        return None
+    key = page_cache.key()
+    entry = page_cache.lookup(key)
+    if entry is None:
+        page_cache.misses += 1
+        g.page_cache_key = key
+        g.page_cache_deps = page_cache.versions(tags)
+        return None
+    page_cache.hits += 1
+    response = current_app.response_class(entry.body, status=entry.status, headers=entry.headers)
+    response.headers['X-Page-Cache'] = 'HIT'
+    return response.make_conditional(request)
+
+
+def _store_response(response):
+    key = g.pop('page_cache_key', None)
+    if key is None:
+        return response
+    if (response.status_code != 200 or response.direct_passthrough or session.modified
+            or response.cache_control.private or not is_shared_request()):
+        return response
+    try:
+        page_cache.store(key, g.page_cache_deps, response)
+    except OSError:
+        logger.exception('Falha ao gravar no cache de páginas')
+        return response
+    response.headers['X-Page-Cache'] = 'MISS'
+    return response
+
+
+def _tags_for(obj, deleted=False):
+    from app.models import Category, Product, Slide
+    if isinstance(obj, Product):
+        tags = {f'product:{obj.id}', 'home', 'search'}
+        if obj.category_id is not None:
+            tags.add(f'category:{obj.category_id}')
+        if not deleted and inspect(obj).persistent:
+            # Produto trocou de categoria: a antiga também muda
+            for old in inspect(obj).attrs.category_id.history.deleted:
+                if old is not None:
+                    tags.add(f'category:{old}')
+        return tags
+    if isinstance(obj, Category):
+        return {LAYOUT_TAG, f'category:{obj.id}'}
+    if isinstance(obj, Slide):
+        return {'home'}
+    return set()
+
+
+def _collect_page_tags(session, flush_context):
+    tags = session.info.setdefault('page_cache_tags', set())
+    for obj in session.new:
+        tags |= _tags_for(obj)
+    for obj in session.dirty:
+        tags |= _tags_for(obj)
+    for obj in session.deleted:
+        tags |= _tags_for(obj, deleted=True)
+
+
+def _apply_page_tags(session):
+    tags = session.info.pop('page_cache_tags', None)
+    if tags:
+        page_cache.invalidate(tags)
+
+
+def invalidate_on_commit(session, tags):
+    # Para UPDATEs do Core (ex.: baixa de estoque), que não passam pelo
+    # after_flush: as tags são invalidadas junto com as do ORM no after_commit
+    if page_cache.enabled and tags:
+        session.info.setdefault('page_cache_tags', set()).update(tags)
+
+
+def _discard_page_tags(session):
+    session.info.pop('page_cache_tags', None)
+
+
+def init_page_cache(app):
+    backend = app.config.get('PAGE_CACHE_BACKEND', 'memory')
+    max_bytes = app.config.get('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+    page_cache.ttl = app.config.get('PAGE_CACHE_TTL', 60)
+    directory = app.config.get('PAGE_CACHE_DIR') or os.path.join(app.instance_path, 'page_cache')
+    if backend == 'memory':
+        page_cache.backend = MemoryBackend(max_bytes, TagStore(os.path.join(directory, 'tags')))
+    elif backend == 'disk':
+        page_cache.backend = DiskBackend(directory, max_bytes)
+    else:
+        page_cache.backend = None
+        return
+
+    app.before_request(_serve_cached)
+    app.after_request(_store_response)
+    if not event.contains(Session, 'after_flush', _collect_page_tags):
+        event.listen(Session, 'after_flush', _collect_page_tags)
+        event.listen(Session, 'after_commit', _apply_page_tags)
+        event.listen(Session, 'after_rollback', _discard_page_tags)
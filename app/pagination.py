@@ -0,0 +1,190 @@
+from collections import namedtuple
+from datetime import datetime
+from flask import request, url_for
+from sqlalchemy import and_, or_, select, func
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+# Contagem aproximada: nunca conta além deste limite (exibido como "N+")
+DEFAULT_COUNT_LIMIT = 10000
+
+SortKey = namedtuple('SortKey', ['column', 'descending'])
+
+
+def asc(column):
+    return SortKey(column, False)
+
+
+def desc(column):
+    return SortKey(column, True)
+
+
+class KeysetPage:
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None, total_is_estimate=False):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+        self.total_is_estimate = total_is_estimate
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def total_display(self):
+        if self.total is None:
+            return ''
+        return f'{self.total}+' if self.total_is_estimate else str(self.total)
+
+    def _url(self, **cursor):
+        args = request.args.to_dict()
+        args.pop('after', None)
+        args.pop('before', None)
+        args.update(cursor)
+        # Parâmetro da query com o nome de um argumento da rota não pode sobrescrevê-lo
+        return url_for(request.endpoint, **{**args, **(request.view_args or {})})
+
+    @property
+    def next_url(self):
+        return self._url(after=self.next_cursor) if self.next_cursor else None
+
+    @property
+    def prev_url(self):
+        return self._url(before=self.prev_cursor) if self.prev_cursor else None
+
+    @property
+    def first_url(self):
+        return self._url()
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    # Cursor vem da URL: só aceita o que encode_cursor produz
+    if isinstance(value, dict):
+        if set(value) != {'dt'} or not isinstance(value['dt'], str):
+            raise ValueError('cursor inválido')
+        return datetime.fromisoformat(value['dt'])
+    if value is not None and not isinstance(value, (str, int, float)):
+        raise ValueError('cursor inválido')
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != size:
+            return None
+        return [_decode_value(v) for v in values]
+    except (ValueError, TypeError):
+        return None
+
+
+def _seek_condition(keys, values, reverse=False):
+    # (a, b) > (x, y)  ==>  a > x OR (a = x AND b > y), respeitando a direção de cada chave
+    clauses = []
+    for i, key in enumerate(keys):
+        descending = key.descending != reverse
+        column, value = key.column, values[i]
+        step = column < value if descending else column > value
+        equals = [keys[j].column == values[j] for j in range(i)]
+        clauses.append(and_(*equals, step) if equals else step)
+    return or_(*clauses)
+
+
+def _order_by(keys, reverse=False):
+    return [
+        key.column.desc() if key.descending != reverse else key.column.asc()
+        for key in keys
+    ]
+
+
+def count_estimate(query, limit=DEFAULT_COUNT_LIMIT):
+    capped = query.order_by(None).limit(limit + 1).subquery()
+    total = query.session.execute(select(func.count()).select_from(capped)).scalar()
+    return min(total, limit), total > limit
+
+
+def keyset_query(query, keys, limit, after_values=None, before_values=None):
+    seek = query
+    if after_values is not None:
+        seek = seek.filter(_seek_condition(keys, after_values))
+    elif before_values is not None:
+        seek = seek.filter(_seek_condition(keys, before_values, reverse=True))
+    return seek.add_columns(*[key.column for key in keys]).order_by(None).order_by(
+        *_order_by(keys, reverse=before_values is not None)
+    ).limit(limit)
+
+
+def paginate_keyset(query, keys, per_page=None, after=None, before=None,
+                    max_per_page=MAX_PAGE_SIZE, with_total=False, count_limit=DEFAULT_COUNT_LIMIT):
+    per_page = max(1, min(per_page or DEFAULT_PAGE_SIZE, max_per_page))
+
+    total, estimate = (None, False)
+    if with_total:
+        total, estimate = count_estimate(query, count_limit)
+
+    after_values = decode_cursor(after, len(keys))
+    before_values = decode_cursor(before, len(keys)) if after_values is None else None
+    backwards = before_values is not None
+
+    rows = keyset_query(query, keys, per_page + 1, after_values, before_values).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    items = [row[0] for row in rows]
+    first_key = list(rows[0][1:]) if rows else None
+    last_key = list(rows[-1][1:]) if rows else None
+
+    if backwards:
+        next_cursor = encode_cursor(last_key) if rows else None
+        prev_cursor = encode_cursor(first_key) if has_more else None
+    else:
+        next_cursor = encode_cursor(last_key) if has_more else None
+        prev_cursor = encode_cursor(first_key) if rows and after_values is not None else None
+
+    return KeysetPage(items, per_page, next_cursor, prev_cursor, total, estimate)
+
+
+def paginate_request(query, keys, default_per_page=DEFAULT_PAGE_SIZE, **kwargs):
+    return paginate_keyset(
+        query,
+        keys,
+        per_page=request.args.get('per_page', default_per_page, type=int),
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        **kwargs
+    )
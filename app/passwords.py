@@ -0,0 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Formato do Werkzeug: scrypt:N:r:p ou pbkdf2:sha256:iterações
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+DEFAULT_QUEUE = 16
+DEFAULT_TIMEOUT = 10
+
+
+class PasswordHashingBusy(Exception):
+    # Fila cheia ou espera longa demais: a rota responde "tente de novo"
+    pass
+
+
+@lru_cache(maxsize=None)
+def canonical_method(method):
+    # 'scrypt' e 'scrypt:32768:8:1' são o mesmo; o prefixo de um hash gerado é a forma canônica
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+class PasswordHasher:
+    # Hash e verificação rodam em um pool limitado: o scrypt/pbkdf2 do hashlib
+    # solta o GIL, então até `workers` cálculos correm em paralelo sem ocupar
+    # todas as CPUs, e no máximo `max_queue` esperam na fila. Acima disso a
+    # requisição é recusada na hora em vez de segurar um worker do gunicorn.
+    def __init__(self, method=DEFAULT_METHOD, workers=None, max_queue=DEFAULT_QUEUE, timeout=DEFAULT_TIMEOUT):
+        self.method = canonical_method(method)
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(self.workers + max_queue)
+        self.rejected = 0
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise PasswordHashingBusy()
+        try:
+            future = self.executor.submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordHashingBusy()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _hasher():
+    if has_app_context():
+        return current_app.extensions.get('password_hasher')
+    return None
+
+
+def hash_password(password):
+    hasher = _hasher()
+    if hasher is None:
+        return generate_password_hash(password, DEFAULT_METHOD)
+    return hasher.hash(password)
+
+
+def verify_password(password_hash, password):
+    hasher = _hasher()
+    if hasher is None:
+        return check_password_hash(password_hash, password)
+    return hasher.verify(password_hash, password)
+
+
+def needs_rehash(password_hash):
+    hasher = _hasher()
+    method = hasher.method if hasher else canonical_method(DEFAULT_METHOD)
+    return password_hash.split('$', 1)[0] != method
+
+
+def init_passwords(app):
+    hasher = PasswordHasher(
+        method=app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+        workers=app.config.get('PASSWORD_HASH_WORKERS'),
+        max_queue=app.config.get('PASSWORD_HASH_QUEUE', DEFAULT_QUEUE),
+        timeout=app.config.get('PASSWORD_HASH_TIMEOUT', DEFAULT_TIMEOUT),
+    )
+    app.extensions['password_hasher'] = hasher
+    logger.debug('Hash de senhas: %s com %s thread(s)', hasher.method, hasher.workers)
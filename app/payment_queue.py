@@ -0,0 +1,360 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask.cli import AppGroup
+from sqlalchemy import select, update, case, func
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models import Order, PaymentNotification
+from app.inventory import commit_order_reservations, release_order_reservations
+from app.mercadopago_client import get_mp_sdk, provider_call
+from app.periodic import PeriodicTask
+from app.sales import record_order_sale, revert_order_sale
+import click
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+PROCESSING = 'processing'
+DONE = 'done'
+FAILED = 'failed'
+
+DEFAULT_BATCH = 20
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 5
+BACKOFF_MAX = 1800
+# Tempo que um worker tem para concluir o job antes de outro poder pegá-lo
+LEASE = timedelta(minutes=5)
+
+_UPSERT_DIALECTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+# Dados do job guardados antes do processamento: o rollback de uma falha expira o objeto
+ClaimedJob = namedtuple('ClaimedJob', ['id', 'topic', 'resource_id', 'attempts'])
+
+
+class PaymentFetchError(Exception):
+    pass
+
+
+def enqueue_notification(topic, resource_id, now=None):
+    # Notificações repetidas caem na mesma linha. Um job já concluído volta
+    # para a fila (o pagamento pode ter mudado, ex.: estorno); um job pendente
+    # ou em andamento só tem received_at atualizado.
+    now = now or datetime.utcnow()
+    table = PaymentNotification.__table__
+    reopen = table.c.status.in_([DONE, FAILED])
+    dialect = db.engine.dialect.name
+    if dialect in _UPSERT_DIALECTS:
+        stmt = _UPSERT_DIALECTS[dialect](table).values(
+            topic=topic, resource_id=resource_id, status=PENDING, attempts=0,
+            received_at=now, next_attempt_at=now, created_at=now,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.topic, table.c.resource_id],
+            set_={
+                'received_at': now,
+                'status': case((reopen, PENDING), else_=table.c.status),
+                'attempts': case((reopen, 0), else_=table.c.attempts),
+                'next_attempt_at': case((reopen, now), else_=table.c.next_attempt_at),
+            },
+        )
+        db.session.execute(stmt)
+        return
+    result = db.session.execute(
+        update(table)
+        .where(table.c.topic == topic)
+        .where(table.c.resource_id == resource_id)
+        .values(
+            received_at=now,
+            status=case((reopen, PENDING), else_=table.c.status),
+            attempts=case((reopen, 0), else_=table.c.attempts),
+            next_attempt_at=case((reopen, now), else_=table.c.next_attempt_at),
+        )
+    )
+    if result.rowcount == 0:
+        db.session.execute(table.insert().values(
+            topic=topic, resource_id=resource_id, status=PENDING, attempts=0,
+            received_at=now, next_attempt_at=now, created_at=now,
+        ))
+
+
+def claim_jobs(limit=DEFAULT_BATCH, now=None):
+    # UPDATE condicional por job: dois workers nunca pegam o mesmo. Jobs
+    # "processing" com o prazo vencido (worker que morreu) são retomados.
+    now = now or datetime.utcnow()
+    table = PaymentNotification.__table__
+    due = (
+        table.c.status.in_([PENDING, PROCESSING]),
+        table.c.next_attempt_at <= now,
+    )
+    # Job que já gastou todas as tentativas e ficou preso (ex.: worker caiu
+    # no meio da última) não volta mais para a fila
+    db.session.execute(
+        update(table)
+        .where(*due)
+        .where(table.c.attempts >= MAX_ATTEMPTS)
+        .values(status=FAILED, last_error=func.coalesce(table.c.last_error, 'tentativas esgotadas'))
+    )
+    ids = db.session.execute(
+        select(table.c.id)
+        .where(*due)
+        .where(table.c.attempts < MAX_ATTEMPTS)
+        .order_by(table.c.next_attempt_at)
+        .limit(limit)
+    ).scalars().all()
+    claimed = []
+    for job_id in ids:
+        result = db.session.execute(
+            update(table)
+            .where(table.c.id == job_id)
+            .where(*due)
+            .where(table.c.attempts < MAX_ATTEMPTS)
+            .values(status=PROCESSING, next_attempt_at=now + LEASE, attempts=table.c.attempts + 1)
+        )
+        if result.rowcount == 1:
+            claimed.append(job_id)
+    db.session.commit()
+    return claimed
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def fetch_payment(sdk, payment_id):
+    if sdk is None:
+        raise PaymentFetchError('SDK do Mercado Pago não configurado')
+    result = provider_call('payment.get', sdk.payment().get, payment_id)
+    if result.get('status') != 200:
+        message = (result.get('response') or {}).get('message')
+        raise PaymentFetchError(f"HTTP {result.get('status')}: {message}")
+    return result['response']
+
+
+def apply_payment(payment):
+    external_reference = payment.get('external_reference')
+    if not external_reference:
+        return None
+    order = db.session.get(Order, int(external_reference))
+    if not order:
+        return None
+    order.payment_id = str(payment['id'])
+
+    if payment['status'] == 'approved':
+        order.payment_status = 'Aprovado'
+        order.status = 'Confirmado'
+        commit_order_reservations(order.id)
+        record_order_sale(order.id)
+    elif payment['status'] == 'pending':
+        order.payment_status = 'Pendente'
+    elif payment['status'] == 'rejected':
+        order.payment_status = 'Rejeitado'
+    elif payment['status'] == 'refunded':
+        order.payment_status = 'Reembolsado'
+        order.status = 'Cancelado'
+        release_order_reservations(order.id, include_committed=True)
+        revert_order_sale(order.id)
+    return order
+
+
+def _retry_later(job, exc, now):
+    # Falha na consulta ou ao aplicar o pagamento: o que foi feito é desfeito
+    # e o job volta com backoff, ou para de vez ao esgotar as tentativas
+    db.session.rollback()
+    failed = job.attempts >= MAX_ATTEMPTS
+    table = PaymentNotification.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.id == job.id)
+        .where(table.c.status == PROCESSING)
+        .values(
+            status=FAILED if failed else PENDING,
+            next_attempt_at=now + backoff(job.attempts),
+            last_error=str(exc)[:1000],
+        )
+    )
+    db.session.commit()
+    log = logger.error if failed else logger.warning
+    log('Notificação %s/%s falhou (tentativa %s): %s', job.topic, job.resource_id, job.attempts, exc)
+
+
+def process_job(job_id, sdk, now=None):
+    job = db.session.get(PaymentNotification, job_id)
+    if job is None or job.status != PROCESSING:
+        return None
+    table = PaymentNotification.__table__
+    claimed = ClaimedJob(job.id, job.topic, job.resource_id, job.attempts)
+    received_at = job.received_at
+    try:
+        if job.topic != 'payment':
+            raise PaymentFetchError(f'tópico não suportado: {job.topic}')
+        payment = fetch_payment(sdk, job.resource_id)
+
+        # O status só é aplicado quando muda; notificações repetidas não refazem nada
+        if payment.get('status') != job.applied_status:
+            apply_payment(payment)
+        done_at = now or datetime.utcnow()
+        # Chegou outra notificação enquanto o pagamento era consultado: volta para
+        # a fila em vez de concluir com uma resposta que pode estar velha
+        result = db.session.execute(
+            update(table)
+            .where(table.c.id == job_id)
+            .where(table.c.received_at == received_at)
+            .values(status=DONE, processed_at=done_at, applied_status=payment.get('status'), last_error=None)
+        )
+        if result.rowcount != 1:
+            db.session.execute(
+                update(table)
+                .where(table.c.id == job_id)
+                .values(status=PENDING, attempts=0, next_attempt_at=done_at, applied_status=payment.get('status'))
+            )
+        db.session.commit()
+    except Exception as exc:
+        _retry_later(claimed, exc, now or datetime.utcnow())
+        return False
+    return True
+
+
+def queue_stats(now=None):
+    now = now or datetime.utcnow()
+    table = PaymentNotification.__table__
+    counts = dict(db.session.execute(
+        select(table.c.status, func.count()).group_by(table.c.status)
+    ).all())
+    oldest = db.session.execute(
+        select(func.min(table.c.received_at)).where(table.c.status.in_([PENDING, PROCESSING]))
+    ).scalar()
+    return {
+        'pending': counts.get(PENDING, 0),
+        'processing': counts.get(PROCESSING, 0),
+        'done': counts.get(DONE, 0),
+        'failed': counts.get(FAILED, 0),
+        # Idade da notificação mais antiga ainda não aplicada
+        'lag_seconds': round((now - oldest).total_seconds(), 1) if oldest else 0,
+    }
+
+
+class PaymentWorker:
+    def __init__(self, app, workers=2, batch_size=DEFAULT_BATCH):
+        self.app = app
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='payment-worker')
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.retried = 0
+        self.max_lag = 0.0
+
+    def run_once(self):
+        # Chamado dentro do contexto do app; cada job roda em uma thread do pool
+        # com sessão própria
+        jobs = claim_jobs(self.batch_size)
+        results = list(self.executor.map(self._process, jobs))
+        return len(results)
+
+    def _process(self, job_id):
+        with self.app.app_context():
+            try:
+                job = db.session.get(PaymentNotification, job_id)
+                received_at = job.received_at if job else None
+                ok = process_job(job_id, get_mp_sdk())
+            except Exception:
+                db.session.rollback()
+                logger.exception('Falha ao processar a notificação %s', job_id)
+                ok = False
+            finally:
+                db.session.remove()
+        with self._lock:
+            if ok:
+                self.processed += 1
+                if received_at:
+                    self.max_lag = max(self.max_lag, (datetime.utcnow() - received_at).total_seconds())
+            else:
+                self.retried += 1
+        return ok
+
+    def stats(self):
+        return {'processed': self.processed, 'retried': self.retried, 'max_lag_seconds': round(self.max_lag, 1)}
+
+
+def wake_worker(app):
+    task = app.extensions.get('payment_worker_task')
+    if task:
+        task.wake()
+
+
+def init_payment_queue(app):
+    interval = app.config.get('PAYMENT_WORKER_INTERVAL', 0)
+    if interval and not app.testing:
+        worker = PaymentWorker(app, app.config.get('PAYMENT_WORKERS', 2), app.config.get('PAYMENT_BATCH', DEFAULT_BATCH))
+        task = PeriodicTask(app, interval, worker.run_once, 'payment-worker')
+        app.extensions['payment_worker'] = worker
+        app.extensions['payment_worker_task'] = task
+        task.start()
+
+
+payments_cli = AppGroup('payments', help='Fila de notificações do Mercado Pago.')
+
+
+@payments_cli.command('work')
+@click.option('--once', is_flag=True, help='Processa o que estiver vencido e sai.')
+@click.option('--workers', default=2, show_default=True)
+@click.option('--batch-size', default=DEFAULT_BATCH, show_default=True)
+@click.option('--interval', default=2.0, show_default=True)
+def work_command(once, workers, batch_size, interval):
+    from flask import current_app
+    worker = PaymentWorker(current_app._get_current_object(), workers, batch_size)
+    if once:
+        click.echo(f'{worker.run_once()} notificação(ões) processada(s).')
+        return
+    task = PeriodicTask(current_app._get_current_object(), interval, worker.run_once, 'payment-worker')
+    click.echo('Processando a fila de pagamentos (Ctrl+C para sair)...')
+    try:
+        while True:
+            task.run_once()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+@payments_cli.command('stats')
+def stats_command():
+    for name, value in queue_stats().items():
+        click.echo(f'{name}: {value}')
+
+
+@payments_cli.command('fake-provider')
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=8081, show_default=True)
+@click.option('--latency', default=0.0, show_default=True, help='Atraso por chamada, em segundos.')
+def fake_provider_command(host, port, latency):
+    from app.fake_mercadopago import make_provider_server
+    server = make_provider_server(host, port, latency)
+    click.echo(f'Dublê do Mercado Pago em http://{host}:{port} (MERCADOPAGO_API_BASE). Ctrl+C para sair.')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+@payments_cli.command('retry')
+def retry_command():
+    # Devolve para a fila as notificações que esgotaram as tentativas
+    table = PaymentNotification.__table__
+    result = db.session.execute(
+        update(table)
+        .where(table.c.status == FAILED)
+        .values(status=PENDING, attempts=0, next_attempt_at=datetime.utcnow())
+    )
+    db.session.commit()
+    click.echo(f'{result.rowcount} notificação(ões) devolvida(s) à fila.')
@@ -0,0 +1,49 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    # Executa func() dentro do contexto do app a cada `interval` segundos,
+    # numa thread daemon. Erros são registrados e a sessão é sempre descartada.
+    def __init__(self, app, interval, func, name):
+        self.app = app
+        self.interval = interval
+        self.func = func
+        self.name = name
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        # Antecipa a próxima execução (ex.: chegou trabalho novo na fila)
+        self._wake.set()
+
+    def run_once(self):
+        from app import db
+        with self.app.app_context():
+            try:
+                return self.func()
+            except Exception:
+                db.session.rollback()
+                logger.exception('Falha na tarefa periódica %s', self.name)
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            self.run_once()
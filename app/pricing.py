@@ -0,0 +1,130 @@
+from collections import namedtuple
+from sqlalchemy import func
+from app import db
+from app.models import CartItem, Product, Coupon
+from app.settings import get_store_settings
+
+QuoteLine = namedtuple('QuoteLine', [
+    'id', 'product_id', 'name', 'code', 'image_url', 'price', 'quantity', 'line_total', 'stock', 'available'
+])
+
+AppliedCoupon = namedtuple('AppliedCoupon', ['id', 'code', 'discount_type', 'discount_value'])
+
+# Motivo da recusa do cupom e a categoria do flash correspondente
+CouponError = namedtuple('CouponError', ['message', 'category'])
+
+
+class CartQuote(namedtuple('CartQuote', [
+    'lines', 'subtotal', 'coupon', 'discount', 'coupon_error',
+    'delivery_type', 'shipping_cost', 'free_shipping', 'total'
+])):
+    __slots__ = ()
+
+    @property
+    def unavailable(self):
+        return tuple(line for line in self.lines if not line.available)
+
+    @property
+    def stock_lines(self):
+        return [(line.product_id, line.quantity) for line in self.lines]
+
+    def __bool__(self):
+        return bool(self.lines)
+
+
+def _money(value):
+    return round(float(value or 0), 2)
+
+
+def cart_lines_query(user_id):
+    # Uma consulta: linhas, totais por linha, disponibilidade e o subtotal
+    # do carrinho inteiro (função de janela sobre o mesmo resultado)
+    line_total = Product.price * CartItem.quantity
+    return db.session.query(
+        CartItem.id,
+        CartItem.product_id,
+        Product.name,
+        Product.code,
+        Product.image_url,
+        Product.price,
+        CartItem.quantity,
+        line_total.label('line_total'),
+        Product.stock,
+        (func.coalesce(Product.stock, 0) >= CartItem.quantity).label('available'),
+        func.sum(line_total).over().label('subtotal'),
+    ).join(Product, Product.id == CartItem.product_id).filter(
+        CartItem.user_id == user_id
+    ).order_by(CartItem.id)
+
+
+def cart_lines(user_id):
+    rows = cart_lines_query(user_id).all()
+
+    lines = tuple(
+        QuoteLine(
+            row.id, row.product_id, row.name, row.code, row.image_url, row.price,
+            row.quantity, _money(row.line_total), row.stock, bool(row.available)
+        )
+        for row in rows
+    )
+    subtotal = _money(rows[0].subtotal) if rows else 0.0
+    return lines, subtotal
+
+
+def guest_cart_lines(items):
+    # items: {product_id: quantidade} do carrinho de visitante. Preço e estoque
+    # são revalidados numa só consulta; produtos removidos ou inativos somem.
+    if not items:
+        return (), 0.0
+    rows = db.session.query(
+        Product.id, Product.name, Product.code, Product.image_url, Product.price, Product.stock
+    ).filter(Product.id.in_(items), Product.active == True).order_by(Product.id).all()
+    lines = tuple(
+        QuoteLine(
+            None, row.id, row.name, row.code, row.image_url, row.price, items[row.id],
+            _money(row.price * items[row.id]), row.stock, (row.stock or 0) >= items[row.id]
+        )
+        for row in rows
+    )
+    return lines, _money(sum(line.line_total for line in lines))
+
+
+def evaluate_coupon(code, subtotal):
+    # Devolve (cupom aplicado, desconto, CouponError ou None)
+    coupon = Coupon.query.filter_by(code=code).first()
+    if not coupon:
+        return None, 0.0, CouponError('Cupom inválido.', 'danger')
+    is_valid, message = coupon.is_valid()
+    if not is_valid:
+        return None, 0.0, CouponError(message, 'danger')
+    if subtotal < (coupon.min_purchase or 0):
+        return None, 0.0, CouponError(
+            f'Compra mínima de R$ {coupon.min_purchase:.2f} necessária para usar este cupom.', 'warning'
+        )
+    applied = AppliedCoupon(coupon.id, coupon.code, coupon.discount_type, coupon.discount_value)
+    return applied, _money(coupon.calculate_discount(subtotal)), None
+
+
+def build_quote(lines, subtotal, coupon_code=None, delivery_type=None):
+    coupon, discount, coupon_error = None, 0.0, None
+    if coupon_code:
+        coupon, discount, coupon_error = evaluate_coupon(coupon_code, subtotal)
+
+    settings = get_store_settings()
+    free_shipping = subtotal >= float(settings.free_shipping_min)
+    shipping_cost = 0.0
+    if delivery_type == 'delivery' and not free_shipping:
+        shipping_cost = _money(settings.shipping_cost)
+
+    total = _money(subtotal - discount + shipping_cost)
+    return CartQuote(lines, subtotal, coupon, discount, coupon_error, delivery_type, shipping_cost, free_shipping, total)
+
+
+def quote_cart(user_id, coupon_code=None, delivery_type=None):
+    lines, subtotal = cart_lines(user_id)
+    return build_quote(lines, subtotal, coupon_code, delivery_type)
+
+
+def quote_guest_cart(items, coupon_code=None):
+    lines, subtotal = guest_cart_lines(items)
+    return build_quote(lines, subtotal, coupon_code)
@@ -0,0 +1,357 @@
+from collections import namedtuple
+from datetime import datetime
+from flask.cli import AppGroup
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+import click
+import csv
+import io
+import itertools
+import logging
+import os
+import time
+import unicodedata
+import zipfile
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+# Só os primeiros erros vão para o relatório; a contagem continua
+MAX_REPORTED_ERRORS = 500
+
+RowError = namedtuple('RowError', ['line', 'code', 'message'])
+
+# Cabeçalhos aceitos (sem acento, minúsculos) -> coluna de Product
+COLUMN_ALIASES = {
+    'codigo': 'code', 'code': 'code', 'sku': 'code',
+    'nome': 'name', 'name': 'name', 'produto': 'name',
+    'descricao': 'description', 'description': 'description',
+    'preco': 'price', 'price': 'price', 'valor': 'price',
+    'estoque': 'stock', 'stock': 'stock', 'quantidade': 'stock',
+    'categoria': 'category', 'category': 'category',
+    'imagem': 'image_url', 'image_url': 'image_url', 'imagem_url': 'image_url',
+    'imagem_2': 'image_url_2', 'image_url_2': 'image_url_2',
+    'imagem_3': 'image_url_3', 'image_url_3': 'image_url_3',
+    'imagem_4': 'image_url_4', 'image_url_4': 'image_url_4',
+    'imagem_5': 'image_url_5', 'image_url_5': 'image_url_5',
+    'ativo': 'active', 'active': 'active',
+    'destaque': 'featured', 'featured': 'featured',
+}
+REQUIRED_COLUMNS = ('code', 'name', 'price')
+TEXT_LIMITS = {
+    'code': 50, 'name': 200,
+    'image_url': 500, 'image_url_2': 500, 'image_url_3': 500, 'image_url_4': 500, 'image_url_5': 500,
+}
+_TRUE = {'1', 'sim', 's', 'true', 'yes', 'y', 'x'}
+_FALSE = {'0', 'nao', 'n', 'false', 'no'}
+_BOOL_DEFAULTS = {'active': True, 'featured': False}
+
+_UPSERT_DIALECTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+        self.elapsed = 0.0
+        # Banco indisponível no meio da importação: os lotes seguintes não foram tentados
+        self.aborted = False
+
+    def add_error(self, line, code, message, rows=1):
+        self.error_count += rows
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(RowError(line, code, message))
+
+    @property
+    def imported(self):
+        return self.created + self.updated
+
+
+def _normalize(value):
+    value = unicodedata.normalize('NFKD', str(value or '')).encode('ascii', 'ignore').decode('ascii')
+    return value.strip().lower().replace(' ', '_').replace('-', '_')
+
+
+def _map_header(header):
+    columns = [COLUMN_ALIASES.get(_normalize(name)) for name in header]
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(missing)}")
+    return columns
+
+
+def iter_csv(stream):
+    # Lê o arquivo aos poucos; aceita ';' (Excel pt-BR) ou ',' como separador
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    head = [line for line in (text.readline() for _ in range(5)) if line]
+    if not head:
+        raise ValueError('Arquivo vazio.')
+    try:
+        dialect = csv.Sniffer().sniff(''.join(head), delimiters=';,\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(itertools.chain(head, text), dialect)
+    yield _map_header(next(reader))
+    yield from reader
+
+
+def iter_xlsx(stream):
+    if openpyxl is None:
+        raise ValueError('Importação de XLSX indisponível: instale openpyxl.')
+    # read_only: as linhas são lidas sob demanda, sem carregar a planilha inteira
+    try:
+        workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    except (OSError, KeyError, zipfile.BadZipFile) as exc:
+        raise ValueError(f'Planilha inválida: {exc}')
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise ValueError('Planilha vazia.')
+        yield _map_header(header)
+        for row in rows:
+            yield ['' if value is None else value for value in row]
+    finally:
+        workbook.close()
+
+
+def iter_rows(stream, filename):
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext == '.xlsx':
+        return iter_xlsx(stream)
+    if ext in ('.csv', '.txt', ''):
+        return iter_csv(stream)
+    raise ValueError('Formato não suportado. Use CSV ou XLSX.')
+
+
+def _parse_price(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = str(value).strip().replace('R$', '').replace(' ', '')
+    if ',' in value:
+        # 1.234,56 -> 1234.56
+        value = value.replace('.', '').replace(',', '.')
+    return float(value)
+
+
+def _parse_int(value):
+    if isinstance(value, (int, float)):
+        return int(value)
+    value = str(value).strip()
+    return int(float(value.replace(',', '.'))) if value else 0
+
+
+def _parse_bool(value, default):
+    if isinstance(value, bool):
+        return value
+    value = _normalize(value)
+    if not value:
+        return default
+    if value in _TRUE:
+        return True
+    if value in _FALSE:
+        return False
+    raise ValueError(f'valor inválido "{value}" (use sim/não)')
+
+
+def parse_row(columns, row, categories):
+    # Retorna o dicionário pronto para o INSERT; só as colunas presentes no arquivo
+    data = {}
+    # Linhas curtas (células finais vazias) são completadas: todas as linhas
+    # do lote precisam das mesmas chaves para o executemany
+    row = list(row) + [''] * (len(columns) - len(row))
+    for column, value in zip(columns, row):
+        if column is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+        if column == 'price':
+            try:
+                data['price'] = _parse_price(value)
+            except (TypeError, ValueError):
+                raise ValueError(f'preço inválido "{value}"')
+            if data['price'] < 0:
+                raise ValueError('preço negativo')
+        elif column == 'stock':
+            try:
+                data['stock'] = _parse_int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f'estoque inválido "{value}"')
+            if data['stock'] < 0:
+                raise ValueError('estoque negativo')
+        elif column in ('active', 'featured'):
+            data[column] = _parse_bool(value, _BOOL_DEFAULTS[column])
+        elif column == 'category':
+            if not value:
+                data['category_id'] = None
+                continue
+            category_id = categories.get(_normalize(value))
+            if category_id is None:
+                raise ValueError(f'categoria "{value}" não encontrada')
+            data['category_id'] = category_id
+        else:
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            value = str(value) if value != '' else None
+            limit = TEXT_LIMITS.get(column)
+            if value and limit and len(value) > limit:
+                raise ValueError(f'{column} com mais de {limit} caracteres')
+            data[column] = value
+    if not data.get('code'):
+        raise ValueError('código vazio')
+    if not data.get('name'):
+        raise ValueError('nome vazio')
+    return data
+
+
+def _upsert_batch(batch, report):
+    from app import db
+    from app.models import Product
+    table = Product.__table__
+    # Mesmo código repetido no lote: vale a última linha
+    rows = list({row['code']: row for row in batch}.values())
+    codes = [row['code'] for row in rows]
+    existing = set(db.session.execute(db.select(table.c.code).where(table.c.code.in_(codes))).scalars())
+
+    now = datetime.utcnow()
+    for row in rows:
+        row['updated_at'] = now
+    columns = [c for c in rows[0] if c != 'code']
+
+    dialect = db.engine.dialect.name
+    if dialect in _UPSERT_DIALECTS:
+        stmt = _UPSERT_DIALECTS[dialect](table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.code],
+            set_={column: stmt.excluded[column] for column in columns},
+        )
+        db.session.execute(stmt, rows)
+    else:
+        new_rows = [row for row in rows if row['code'] not in existing]
+        old_rows = [row for row in rows if row['code'] in existing]
+        if new_rows:
+            db.session.execute(table.insert(), new_rows)
+        if old_rows:
+            db.session.execute(
+                table.update().where(table.c.code == db.bindparam('_code')).values(
+                    {column: db.bindparam(column) for column in columns}
+                ),
+                [{**row, '_code': row['code']} for row in old_rows],
+            )
+    db.session.commit()
+    report.updated += len(existing)
+    report.created += len(rows) - len(existing)
+
+
+def _write_batch(batch, lines, report):
+    # Os lotes anteriores já foram confirmados: uma falha aqui perde só este
+    # lote, que vai para o relatório como um intervalo de linhas
+    from app import db
+    try:
+        _upsert_batch(batch, report)
+    except SQLAlchemyError as exc:
+        db.session.rollback()
+        message = str(getattr(exc, 'orig', None) or exc).splitlines()[0]
+        report.add_error(f'{lines[0]}-{lines[-1]}', None, f'lote não gravado: {message}', rows=len(batch))
+        if isinstance(exc, OperationalError):
+            report.aborted = True
+        logger.warning('Importação de produtos: lote das linhas %s-%s falhou: %s', lines[0], lines[-1], message)
+
+
+def _invalidate_catalog():
+    # As instruções em lote não passam pelos eventos da sessão do ORM
+    from app.cache import home_page_cache
+    from app.page_cache import page_cache
+    home_page_cache.invalidate()
+    page_cache.clear()
+
+
+def import_products(rows, batch_size=BATCH_SIZE, on_progress=None):
+    from app.cache import category_cache
+    report = ImportReport()
+    started = time.monotonic()
+    categories = {_normalize(c.name): c.id for c in category_cache.all()}
+
+    rows = iter(rows)
+    try:
+        columns = next(rows)
+    except (ValueError, csv.Error, UnicodeDecodeError) as exc:
+        report.add_error(1, None, str(exc))
+        return report
+
+    batch = []
+    lines = []
+    try:
+        for line, row in enumerate(rows, start=2):
+            if not any(str(value).strip() for value in row):
+                continue
+            report.rows += 1
+            try:
+                batch.append(parse_row(columns, row, categories))
+            except ValueError as exc:
+                code = next((v for c, v in zip(columns, row) if c == 'code'), None)
+                report.add_error(line, code, str(exc))
+                continue
+            lines.append(line)
+            if len(batch) >= batch_size:
+                _write_batch(batch, lines, report)
+                batch = []
+                lines = []
+                if report.aborted:
+                    break
+                if on_progress:
+                    on_progress(report)
+        if batch:
+            _write_batch(batch, lines, report)
+    except (csv.Error, UnicodeDecodeError) as exc:
+        report.add_error(report.rows + 1, None, f'arquivo inválido: {exc}')
+    finally:
+        if report.imported:
+            _invalidate_catalog()
+        report.elapsed = time.monotonic() - started
+
+    if on_progress:
+        on_progress(report)
+    logger.info(
+        'Importação de produtos: %s linha(s), %s criado(s), %s atualizado(s), %s erro(s) em %.1fs',
+        report.rows, report.created, report.updated, report.error_count, report.elapsed,
+    )
+    return report
+
+
+products_cli = AppGroup('products', help='Importação de produtos em lote.')
+
+
+@products_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True)
+def import_command(path, batch_size):
+    def progress(report):
+        click.echo(f'{report.rows} linha(s) lida(s), {report.imported} gravada(s), {report.error_count} erro(s)')
+
+    with open(path, 'rb') as f:
+        try:
+            rows = iter_rows(f, path)
+        except ValueError as exc:
+            raise click.ClickException(str(exc))
+        report = import_products(rows, batch_size=batch_size, on_progress=progress)
+
+    for error in report.errors:
+        click.echo(f'linha {error.line} [{error.code or "-"}]: {error.message}')
+    if report.aborted:
+        click.echo('Importação interrompida: o banco de dados recusou a gravação.')
+    click.echo(
+        f'{report.created} criado(s), {report.updated} atualizado(s), '
+        f'{report.error_count} erro(s) em {report.elapsed:.1f}s.'
+    )
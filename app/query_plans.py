@@ -0,0 +1,170 @@
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import joinedload
+from app import db
+from app.models import Product, Order, OrderItem, CartItem, Wishlist, Review, Coupon, StockReservation, PaymentNotification
+from app.pagination import keyset_query, asc, desc
+from app.pricing import cart_lines_query
+from app.order_export import export_query
+from app.sales import best_sellers_query
+from app.payment_queue import PENDING, PROCESSING
+import re
+
+PlanCheck = namedtuple('PlanCheck', ['name', 'build'])
+PlanResult = namedtuple('PlanResult', ['name', 'ok', 'plan'])
+
+# Valores de exemplo: o plano depende só do formato da consulta, não dos dados
+SAMPLE_ID = 1
+SAMPLE_NAME = 'Arduino'
+SAMPLE_DATE = datetime(2024, 1, 1)
+
+_FULL_SCAN_RE = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+def _category_page():
+    query = Product.query.filter_by(category_id=SAMPLE_ID, active=True)
+    return keyset_query(query, [asc(Product.name), asc(Product.id)], 25, [SAMPLE_NAME, SAMPLE_ID])
+
+
+def _category_page_by_rating():
+    query = Product.query.filter_by(category_id=SAMPLE_ID, active=True)
+    return keyset_query(query, [desc(Product.rating_avg), desc(Product.id)], 25, [4.5, SAMPLE_ID])
+
+
+def _product_reviews():
+    query = Review.query.filter_by(product_id=SAMPLE_ID).options(joinedload(Review.user))
+    return keyset_query(query, [desc(Review.created_at), desc(Review.id)], 11, [SAMPLE_DATE, SAMPLE_ID])
+
+
+def _related_products():
+    return Product.query.filter(
+        Product.category_id == SAMPLE_ID,
+        Product.id != SAMPLE_ID,
+        Product.active == True
+    ).limit(4)
+
+
+def _search():
+    from app.search import search_query, fts_enabled
+    if not fts_enabled():
+        return None
+    results, keys = search_query(SAMPLE_NAME)
+    return keyset_query(results, keys, 25)
+
+
+def _my_orders():
+    query = Order.query.filter_by(user_id=SAMPLE_ID)
+    return keyset_query(query, [desc(Order.created_at), desc(Order.id)], 11, [SAMPLE_DATE, SAMPLE_ID])
+
+
+def _verified_purchase():
+    return db.session.query(OrderItem).join(Order).filter(
+        Order.user_id == SAMPLE_ID,
+        OrderItem.product_id == SAMPLE_ID
+    ).limit(1)
+
+
+def _wishlist_page():
+    return Wishlist.query.filter_by(user_id=SAMPLE_ID).options(
+        joinedload(Wishlist.product)
+    ).order_by(Wishlist.created_at.desc(), Wishlist.id.desc())
+
+
+def _admin_orders():
+    query = Order.query.options(joinedload(Order.user))
+    return keyset_query(query, [desc(Order.created_at), desc(Order.id)], 51, [SAMPLE_DATE, SAMPLE_ID])
+
+
+def _expired_reservations():
+    table = StockReservation.__table__
+    return db.select(table.c.id).where(
+        table.c.status == 'reserved'
+    ).where(table.c.expires_at < SAMPLE_DATE).order_by(table.c.expires_at).limit(200)
+
+
+def _payment_jobs_due():
+    table = PaymentNotification.__table__
+    return db.select(table.c.id).where(
+        table.c.status.in_([PENDING, PROCESSING])
+    ).where(table.c.next_attempt_at <= SAMPLE_DATE).order_by(table.c.next_attempt_at).limit(20)
+
+
+# Consultas principais de cada rota; os planos são conferidos em um banco vazio
+PLAN_CHECKS = (
+    PlanCheck('main.index (destaques)', lambda: Product.query.filter_by(featured=True, active=True).order_by(Product.id).limit(12)),
+    PlanCheck('main.product_detail (relacionados)', _related_products),
+    PlanCheck('main.category_products', _category_page),
+    PlanCheck('main.category_products (por avaliação)', _category_page_by_rating),
+    PlanCheck('main.category_products (ETag)', lambda: db.session.query(func.max(Product.updated_at), func.count(Product.id)).filter(Product.category_id == SAMPLE_ID)),
+    PlanCheck('main.search', _search),
+    PlanCheck('cart.view_cart', lambda: cart_lines_query(SAMPLE_ID)),
+    PlanCheck('cart.add_to_cart', lambda: CartItem.query.filter_by(user_id=SAMPLE_ID, product_id=SAMPLE_ID).limit(1)),
+    PlanCheck('cart.my_orders', _my_orders),
+    PlanCheck('cart.my_orders (itens)', lambda: OrderItem.query.filter(OrderItem.order_id.in_([SAMPLE_ID, SAMPLE_ID + 1]))),
+    PlanCheck('wishlist.view_wishlist', _wishlist_page),
+    PlanCheck('wishlists.wishlist_product_ids', lambda: db.select(Wishlist.product_id).where(Wishlist.user_id == SAMPLE_ID)),
+    PlanCheck('reviews.add_review', lambda: Review.query.filter_by(user_id=SAMPLE_ID, product_id=SAMPLE_ID).limit(1)),
+    PlanCheck('reviews.add_review (compra verificada)', _verified_purchase),
+    PlanCheck('main.product_detail (avaliações)', _product_reviews),
+    PlanCheck('admin.dashboard (recentes)', lambda: Order.query.order_by(Order.created_at.desc()).limit(5)),
+    PlanCheck('admin.dashboard (por status)', lambda: Order.query.filter_by(status='Pendente').with_entities(func.count())),
+    PlanCheck('admin.dashboard (estoque baixo)', lambda: Product.query.filter(Product.stock < 10).with_entities(func.count())),
+    PlanCheck('admin.dashboard (mais vendidos)', lambda: best_sellers_query(5)),
+    PlanCheck('admin.products', lambda: keyset_query(Product.query, [asc(Product.name), asc(Product.id)], 51, [SAMPLE_NAME, SAMPLE_ID])),
+    PlanCheck('admin.orders', _admin_orders),
+    PlanCheck('admin.export_orders', lambda: export_query(SAMPLE_DATE, SAMPLE_DATE)),
+    PlanCheck('admin.order_detail (itens)', lambda: OrderItem.query.filter_by(order_id=SAMPLE_ID)),
+    PlanCheck('admin.coupons', lambda: keyset_query(Coupon.query, [desc(Coupon.created_at), desc(Coupon.id)], 51, [SAMPLE_DATE, SAMPLE_ID])),
+    PlanCheck('inventory.release_expired_reservations', _expired_reservations),
+    PlanCheck('payment_queue.claim_jobs', _payment_jobs_due),
+    PlanCheck('payment_queue.queue_stats', lambda: db.select(func.min(PaymentNotification.received_at)).where(PaymentNotification.status.in_([PENDING, PROCESSING]))),
+    PlanCheck('inventory.order_reservations', lambda: StockReservation.query.filter_by(order_id=SAMPLE_ID)),
+)
+
+
+def full_scans(plan, tables):
+    # "SCAN tabela" sem índice; "SCAN tabela USING INDEX" percorre um índice em ordem
+    scans = []
+    for line in plan:
+        match = _FULL_SCAN_RE.match(line.strip())
+        if not match:
+            continue
+        # Tabelas em joinedload aparecem com o apelido gerado (product_1)
+        name = match.group(1)
+        if name not in tables:
+            name = re.sub(r'_\d+$', '', name)
+        if name in tables:
+            scans.append(name)
+    return scans
+
+
+def explain(conn, statement):
+    if hasattr(statement, 'statement'):
+        statement = statement.statement
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={'render_postcompile': True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup or ())
+    rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + compiled.string, params).all()
+    return [row[3] for row in rows]
+
+
+def check_query_plans(checks=PLAN_CHECKS):
+    from app.search import create_search_schema
+    # Banco SQLite vazio com o esquema atual: sem sqlite_stat1, o planejador
+    # não troca um índice por varredura só porque a tabela local é pequena.
+    engine = create_engine('sqlite://')
+    tables = set(db.metadata.tables)
+    results = []
+    try:
+        with engine.begin() as conn:
+            db.metadata.create_all(conn)
+            create_search_schema(conn)
+            for check in checks:
+                statement = check.build()
+                if statement is None:
+                    continue
+                plan = explain(conn, statement)
+                results.append(PlanResult(check.name, not full_scans(plan, tables), plan))
+    finally:
+        engine.dispose()
+    return results
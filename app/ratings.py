@@ -0,0 +1,71 @@
+from datetime import datetime
+from flask.cli import AppGroup
+from sqlalchemy import select, update, func, case
+from app import db
+from app.models import Product, Review
+import click
+
+STARS = range(1, 6)
+
+
+def _avg(count, total):
+    return case((count > 0, total * 1.0 / count), else_=0)
+
+
+def apply_review_change(product, old_rating=None, new_rating=None):
+    # Atualiza o agregado do produto na mesma transação da avaliação. As
+    # atribuições são expressões SQL (coluna + delta): duas avaliações
+    # simultâneas não se sobrescrevem. Como o Product fica sujo, os caches
+    # de página e do catálogo são invalidados pelos eventos da sessão.
+    count_delta = (new_rating is not None) - (old_rating is not None)
+    sum_delta = (new_rating or 0) - (old_rating or 0)
+    if count_delta or sum_delta:
+        product.rating_count = Product.rating_count + count_delta
+        product.rating_sum = Product.rating_sum + sum_delta
+        product.rating_avg = _avg(Product.rating_count + count_delta, Product.rating_sum + sum_delta)
+    if old_rating != new_rating:
+        if old_rating is not None:
+            column = f'rating_{old_rating}'
+            setattr(product, column, getattr(Product, column) - 1)
+        if new_rating is not None:
+            column = f'rating_{new_rating}'
+            setattr(product, column, getattr(Product, column) + 1)
+    # Mesmo sem mudar a nota (só o comentário), a página do produto mudou
+    product.updated_at = datetime.utcnow()
+
+
+def rebuild_ratings(conn):
+    # Recalcula todos os produtos a partir de Review com subconsultas correlacionadas
+    products = Product.__table__
+    reviews = Review.__table__
+
+    def aggregate(expression):
+        return select(func.coalesce(expression, 0)).where(
+            reviews.c.product_id == products.c.id
+        ).scalar_subquery()
+
+    count = aggregate(func.count(reviews.c.id))
+    total = aggregate(func.sum(reviews.c.rating))
+    values = {
+        'rating_count': count,
+        'rating_sum': total,
+        'rating_avg': _avg(count, total),
+    }
+    for stars in STARS:
+        values[f'rating_{stars}'] = aggregate(func.sum(case((reviews.c.rating == stars, 1), else_=0)))
+    return conn.execute(update(products).values(values)).rowcount
+
+
+ratings_cli = AppGroup('ratings', help='Agregado das avaliações por produto.')
+
+
+@ratings_cli.command('rebuild')
+def rebuild_command():
+    from app.cache import home_page_cache
+    from app.page_cache import page_cache
+    with db.engine.begin() as conn:
+        updated = rebuild_ratings(conn)
+    # UPDATE direto: não passa pelos eventos da sessão
+    home_page_cache.invalidate()
+    page_cache.clear()
+    click.echo(f'Avaliações recalculadas para {updated} produto(s).')
@@ -1,10 +1,21 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, Response, render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
 from functools import wraps
 from sqlalchemy import or_
+from sqlalchemy.orm import joinedload, selectinload
 from werkzeug.utils import secure_filename
 from app import db
-from app.models import Product, Category, Order, User, Coupon, StoreSettings, Slide
+from app.models import Product, Category, Order, OrderItem, User, Coupon, StoreSettings, Slide
+from app.cache import category_cache, cache_stats as catalog_cache_stats
+from app.page_cache import page_cache
+from app.images import image_pipeline
+from app.wishlists import wishlist_cache
+from app.payment_queue import queue_stats
+from app.mercadopago_client import provider_latency
+from app.pagination import paginate_request, asc, desc
+from app.settings import get_store_settings, serialize_value, SETTINGS_BY_KEY
+from app.inventory import commit_order_reservations, release_order_reservations
+from app.sales import sync_order_sale, best_sellers as sales_best_sellers
 from datetime import datetime
 import os
 import secrets
@@ -24,42 +35,58 @@ def admin_required(f):
 @login_required
 @admin_required
 def dashboard():
-    total_products = Product.query.count()
-    total_orders = Order.query.count()
-    total_users = User.query.count()
-    recent_orders = Order.query.order_by(Order.created_at.desc()).limit(5).all()
-    
-    # Estatísticas de estoque
-    low_stock_products = Product.query.filter(Product.stock < 10).count()
-    out_of_stock = Product.query.filter(Product.stock == 0).count()
-    
-    # Estatísticas de pedidos
-    pending_orders = Order.query.filter_by(status='Pendente').count()
-    confirmed_orders = Order.query.filter_by(status='Confirmado').count()
-    
-    # Receita total (apenas pedidos confirmados)
-    total_revenue = db.session.query(db.func.sum(Order.total)).filter(Order.status == 'Confirmado').scalar() or 0
+    from app.models import DailySales
+    
+    def count(*filters):
+        return db.select(db.func.count()).select_from(filters[0]).where(*filters[1:]).scalar_subquery()
+    
+    # Contadores e receita em uma única consulta; a receita vem do acumulado diário
+    stats = db.session.execute(db.select(
+        count(Product.__table__).label('total_products'),
+        count(Order.__table__).label('total_orders'),
+        count(User.__table__).label('total_users'),
+        count(Product.__table__, Product.stock < 10).label('low_stock_products'),
+        count(Product.__table__, Product.stock == 0).label('out_of_stock'),
+        count(Order.__table__, Order.status == 'Pendente').label('pending_orders'),
+        count(Order.__table__, Order.status == 'Confirmado').label('confirmed_orders'),
+        db.func.coalesce(db.select(db.func.sum(DailySales.revenue)).scalar_subquery(), 0).label('total_revenue'),
+    )).one()
     
-    # Produtos mais vendidos (top 5) - apenas pedidos confirmados
-    from app.models import OrderItem
-    from sqlalchemy import func
-    best_sellers = db.session.query(
-        Product.name,
-        func.sum(OrderItem.quantity).label('total_sold')
-    ).join(OrderItem).join(Order).filter(Order.status == 'Confirmado').group_by(Product.id).order_by(func.sum(OrderItem.quantity).desc()).limit(5).all()
+    recent_orders = Order.query.order_by(Order.created_at.desc()).limit(5).all()
+    best_sellers = sales_best_sellers(5)
     
     return render_template('admin/dashboard.html', 
-                         total_products=total_products,
-                         total_orders=total_orders,
-                         total_users=total_users,
+                         total_products=stats.total_products,
+                         total_orders=stats.total_orders,
+                         total_users=stats.total_users,
                          recent_orders=recent_orders,
-                         low_stock_products=low_stock_products,
-                         out_of_stock=out_of_stock,
-                         pending_orders=pending_orders,
-                         confirmed_orders=confirmed_orders,
-                         total_revenue=total_revenue,
+                         low_stock_products=stats.low_stock_products,
+                         out_of_stock=stats.out_of_stock,
+                         pending_orders=stats.pending_orders,
+                         confirmed_orders=stats.confirmed_orders,
+                         total_revenue=stats.total_revenue,
                          best_sellers=best_sellers)
 
+@admin_bp.route('/cache')
+@login_required
+@admin_required
+def cache_stats():
+    stats = catalog_cache_stats()
+    stats['pages'] = page_cache.stats()
+    stats['wishlists'] = wishlist_cache.stats()
+    return jsonify(stats)
+
+@admin_bp.route('/pagamentos/fila')
+@login_required
+@admin_required
+def payment_queue_stats():
+    stats = queue_stats()
+    worker = current_app.extensions.get('payment_worker')
+    if worker:
+        stats['worker'] = worker.stats()
+    stats['provider_latency'] = provider_latency.snapshot()
+    return jsonify(stats)
+
 @admin_bp.route('/produtos')
 @login_required
 @admin_required
@@ -91,8 +118,8 @@ def products():
     if stock_alert == 'low':
         query = query.filter(Product.stock < 10)
     
-    products = query.all()
-    categories = Category.query.all()
+    products = paginate_request(query, [asc(Product.name), asc(Product.id)], default_per_page=50, with_total=True)
+    categories = category_cache.all()
     
     low_stock_count = Product.query.filter(Product.stock < 10).count()
     
@@ -144,9 +171,38 @@ def add_product():
         flash('Produto adicionado com sucesso!', 'success')
         return redirect(url_for('admin.products'))
     
-    categories = Category.query.all()
+    categories = category_cache.all()
     return render_template('admin/add_product.html', categories=categories)
 
+@admin_bp.route('/produtos/importar', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def import_products():
+    from app.product_import import iter_rows, import_products as run_import
+    
+    report = None
+    if request.method == 'POST':
+        file = request.files.get('file')
+        if not file or not file.filename:
+            flash('Selecione um arquivo CSV ou XLSX.', 'danger')
+            return redirect(url_for('admin.import_products'))
+        
+        try:
+            rows = iter_rows(file.stream, file.filename)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('admin.import_products'))
+        
+        report = run_import(rows)
+        if report.imported:
+            flash(f'{report.created} produto(s) criado(s) e {report.updated} atualizado(s).', 'success')
+        if report.error_count:
+            flash(f'{report.error_count} linha(s) com erro não foram importadas.', 'warning')
+        if report.aborted:
+            flash('Importação interrompida: o banco de dados recusou a gravação. Envie o arquivo novamente.', 'danger')
+    
+    return render_template('admin/import_products.html', report=report)
+
 @admin_bp.route('/produtos/editar/<int:product_id>', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -173,7 +229,7 @@ def edit_product(product_id):
         flash('Produto atualizado com sucesso!', 'success')
         return redirect(url_for('admin.products'))
     
-    categories = Category.query.all()
+    categories = category_cache.all()
     return render_template('admin/edit_product.html', product=product, categories=categories)
 
 @admin_bp.route('/produtos/deletar/<int:product_id>', methods=['POST'])
@@ -192,7 +248,10 @@ def delete_product(product_id):
 @admin_required
 def categories():
     categories = Category.query.all()
-    return render_template('admin/categories.html', categories=categories)
+    product_counts = dict(
+        db.session.query(Product.category_id, db.func.count(Product.id)).group_by(Product.category_id).all()
+    )
+    return render_template('admin/categories.html', categories=categories, product_counts=product_counts)
 
 @admin_bp.route('/categorias/adicionar', methods=['GET', 'POST'])
 @login_required
@@ -223,6 +282,7 @@ def add_category():
                     
                     # Atualizar image_url com o caminho do arquivo
                     image_url = f'/static/images/{unique_filename}'
+                    image_pipeline.schedule(image_url)
                 else:
                     flash('Formato de imagem não permitido! Use JPG, PNG, GIF ou WEBP.', 'danger')
                     return redirect(url_for('admin.add_category'))
@@ -266,6 +326,7 @@ def edit_category(category_id):
                     
                     # Atualizar image_url com o caminho do arquivo
                     category.image_url = f'/static/images/{unique_filename}'
+                    image_pipeline.schedule(category.image_url)
                 else:
                     flash('Formato de imagem não permitido! Use JPG, PNG, GIF ou WEBP.', 'danger')
                     return redirect(url_for('admin.edit_category', category_id=category_id))
@@ -303,14 +364,50 @@ def delete_category(category_id):
 @login_required
 @admin_required
 def orders():
-    orders = Order.query.order_by(Order.created_at.desc()).all()
+    orders = paginate_request(
+        Order.query.options(joinedload(Order.user)),
+        [desc(Order.created_at), desc(Order.id)],
+        default_per_page=50,
+        with_total=True
+    )
     return render_template('admin/orders.html', orders=orders)
 
+@admin_bp.route('/pedidos/exportar')
+@login_required
+@admin_required
+def export_orders():
+    from app.order_export import EXPORT_FORMATS, export_orders as build_export, parse_date
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'csv'
+    try:
+        start = parse_date(request.args.get('start'))
+        end = parse_date(request.args.get('end'))
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('admin.orders'))
+    status = request.args.get('status') or None
+    
+    # O gerador usa uma conexão própria; a sessão da requisição é liberada antes do streaming
+    chunks = build_export(db.engine, fmt, start=start, end=end, status=status)
+    db.session.remove()
+    filename = f"pedidos-{datetime.utcnow().strftime('%Y%m%d-%H%M')}.{fmt}"
+    response = Response(chunks, content_type=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    # Sem buffer no proxy: as linhas vão saindo enquanto a consulta avança
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @admin_bp.route('/pedidos/<int:order_id>')
 @login_required
 @admin_required
 def order_detail(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = Order.query.options(
+        joinedload(Order.user),
+        selectinload(Order.items).joinedload(OrderItem.product)
+    ).filter_by(id=order_id).first_or_404()
     return render_template('admin/order_detail.html', order=order)
 
 @admin_bp.route('/pedidos/atualizar-status/<int:order_id>', methods=['POST'])
@@ -320,6 +417,13 @@ def update_order_status(order_id):
     order = Order.query.get_or_404(order_id)
     status = request.form.get('status')
     
+    if status != order.status:
+        if status in ('Confirmado', 'Enviado', 'Entregue'):
+            commit_order_reservations(order.id)
+        elif status == 'Cancelado':
+            release_order_reservations(order.id, include_committed=True)
+        sync_order_sale(order.id, status)
+    
     order.status = status
     db.session.commit()
     
@@ -330,7 +434,7 @@ def update_order_status(order_id):
 @login_required
 @admin_required
 def coupons():
-    coupons = Coupon.query.order_by(Coupon.created_at.desc()).all()
+    coupons = paginate_request(Coupon.query, [desc(Coupon.created_at), desc(Coupon.id)], default_per_page=50)
     return render_template('admin/coupons.html', coupons=coupons)
 
 @admin_bp.route('/cupons/adicionar', methods=['GET', 'POST'])
@@ -416,22 +520,29 @@ def toggle_coupon(coupon_id):
 @admin_required
 def store_settings():
     if request.method == 'POST':
-        StoreSettings.set_setting('pickup_enabled', 'true' if request.form.get('pickup_enabled') else 'false')
-        StoreSettings.set_setting('pickup_address', request.form.get('pickup_address', ''))
-        StoreSettings.set_setting('delivery_enabled', 'true' if request.form.get('delivery_enabled') else 'false')
-        StoreSettings.set_setting('free_shipping_min', request.form.get('free_shipping_min', '300'))
-        StoreSettings.set_setting('shipping_cost', request.form.get('shipping_cost', '15'))
+        form_values = {
+            'pickup_enabled': bool(request.form.get('pickup_enabled')),
+            'pickup_address': request.form.get('pickup_address', ''),
+            'delivery_enabled': bool(request.form.get('delivery_enabled')),
+            'free_shipping_min': request.form.get('free_shipping_min', '300'),
+            'shipping_cost': request.form.get('shipping_cost', '15'),
+        }
+        
+        try:
+            values = {
+                key: serialize_value(SETTINGS_BY_KEY[key], value)
+                for key, value in form_values.items()
+            }
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('admin.store_settings'))
+        
+        StoreSettings.set_many(values)
         
         flash('Configurações atualizadas com sucesso!', 'success')
         return redirect(url_for('admin.store_settings'))
     
-    settings = {
-        'pickup_enabled': StoreSettings.get_setting('pickup_enabled', 'true') == 'true',
-        'pickup_address': StoreSettings.get_setting('pickup_address', ''),
-        'delivery_enabled': StoreSettings.get_setting('delivery_enabled', 'true') == 'true',
-        'free_shipping_min': float(StoreSettings.get_setting('free_shipping_min', '300')),
-        'shipping_cost': float(StoreSettings.get_setting('shipping_cost', '15'))
-    }
+    settings = get_store_settings()._asdict()
     
     return render_template('admin/store_settings.html', settings=settings)
 
@@ -2,9 +2,24 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from app import db
 from app.models import User
+from app.session_cart import merge_guest_cart
+from app.passwords import PasswordHashingBusy
 
 auth_bp = Blueprint('auth', __name__)
 
+_BUSY_TEMPLATES = {
+    'auth.login': 'login.html',
+    'auth.register': 'register.html',
+    'auth.change_password': 'change_password.html',
+}
+
+@auth_bp.errorhandler(PasswordHashingBusy)
+def password_hashing_busy(error):
+    # Pool de hash de senhas cheio: responde na hora em vez de enfileirar mais
+    flash('Muitos acessos no momento. Tente novamente em alguns segundos.', 'warning')
+    response = render_template(_BUSY_TEMPLATES.get(request.endpoint, 'login.html'))
+    return response, 503, {'Retry-After': '5'}
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
@@ -17,8 +32,15 @@ def login():
         user = User.query.filter_by(email=email).first()
         
         if user and user.check_password(password):
+            if user.password_needs_rehash():
+                # Parâmetros do hash mudaram: regrava com os atuais aproveitando a senha em mãos
+                user.set_password(password)
+                db.session.commit()
             login_user(user)
+            merge_guest_cart(user.id)
             next_page = request.args.get('next')
+            if next_page and (not next_page.startswith('/') or next_page.startswith('//')):
+                next_page = None
             flash('Login realizado com sucesso!', 'success')
             return redirect(next_page) if next_page else redirect(url_for('main.index'))
         else:
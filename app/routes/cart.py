@@ -1,54 +1,58 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, session, current_app
 from flask_login import login_required, current_user
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
 from app import db
-from app.models import Product, CartItem, Order, OrderItem, Coupon, StoreSettings
+from app.models import Product, CartItem, Order, OrderItem
+from app.settings import get_store_settings
+from app.pricing import quote_cart, quote_guest_cart
+from app.session_cart import guest_items, add_guest_item, remove_guest_item, set_guest_items
+from app.inventory import reserve_stock, consume_coupon, OutOfStockError, CouponExhaustedError
+from app.pagination import paginate_request, asc, desc
 
 cart_bp = Blueprint('cart', __name__)
 
+def _current_quote(coupon_code=None):
+    if current_user.is_authenticated:
+        return quote_cart(current_user.id, coupon_code)
+    items = guest_items()
+    quote = quote_guest_cart(items, coupon_code)
+    if len(quote.lines) != len(items):
+        # Produtos removidos ou desativados saem do carrinho do visitante
+        set_guest_items({line.product_id: line.quantity for line in quote.lines})
+    return quote
+
 @cart_bp.route('/carrinho')
-@login_required
 def view_cart():
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-    subtotal = sum(item.product.price * item.quantity for item in cart_items)
-    
-    coupon_code = session.get('coupon_code')
-    coupon = None
-    discount = 0
-    total = subtotal
-    
-    if coupon_code:
-        coupon = Coupon.query.filter_by(code=coupon_code).first()
-        if coupon:
-            is_valid, message = coupon.is_valid()
-            if is_valid and subtotal >= coupon.min_purchase:
-                discount = coupon.calculate_discount(subtotal)
-                total = subtotal - discount
-            else:
-                session.pop('coupon_code', None)
-                coupon = None
-    
-    pickup_enabled = StoreSettings.get_setting('pickup_enabled', 'true') == 'true'
-    pickup_address = StoreSettings.get_setting('pickup_address', '')
-    delivery_enabled = StoreSettings.get_setting('delivery_enabled', 'true') == 'true'
-    shipping_cost = float(StoreSettings.get_setting('shipping_cost', '15'))
-    free_shipping_min = float(StoreSettings.get_setting('free_shipping_min', '300'))
-    
-    return render_template('cart.html', cart_items=cart_items, subtotal=subtotal, 
-                         discount=discount, total=total, coupon=coupon,
-                         pickup_enabled=pickup_enabled, pickup_address=pickup_address,
-                         delivery_enabled=delivery_enabled, shipping_cost=shipping_cost,
-                         free_shipping_min=free_shipping_min)
+    quote = _current_quote(session.get('coupon_code'))
+    if quote.coupon_error:
+        session.pop('coupon_code', None)
+    
+    settings = get_store_settings()
+    
+    return render_template('cart.html', quote=quote, cart_items=quote.lines, subtotal=quote.subtotal, 
+                         discount=quote.discount, total=quote.total, coupon=quote.coupon,
+                         pickup_enabled=settings.pickup_enabled, pickup_address=settings.pickup_address,
+                         delivery_enabled=settings.delivery_enabled, shipping_cost=float(settings.shipping_cost),
+                         free_shipping_min=float(settings.free_shipping_min))
 
 @cart_bp.route('/adicionar-carrinho/<int:product_id>', methods=['POST'])
-@login_required
 def add_to_cart(product_id):
     product = Product.query.get_or_404(product_id)
-    quantity = int(request.form.get('quantity', 1))
+    quantity = request.form.get('quantity', 1, type=int) or 1
     
-    if product.stock < quantity:
+    if quantity < 1 or product.stock < quantity:
         flash('Quantidade indisponível em estoque.', 'warning')
         return redirect(url_for('main.product_detail', product_id=product_id))
     
+    if not current_user.is_authenticated:
+        # Visitante: o carrinho fica no cookie de sessão até o login
+        if not add_guest_item(product.id, quantity):
+            flash('Seu carrinho atingiu o limite de itens.', 'warning')
+            return redirect(url_for('cart.view_cart'))
+        flash(f'{product.name} adicionado ao carrinho!', 'success')
+        return redirect(url_for('cart.view_cart'))
+    
     cart_item = CartItem.query.filter_by(user_id=current_user.id, product_id=product_id).first()
     
     if cart_item:
@@ -57,7 +61,15 @@ def add_to_cart(product_id):
         cart_item = CartItem(user_id=current_user.id, product_id=product_id, quantity=quantity)
         db.session.add(cart_item)
     
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Outra requisição incluiu o mesmo produto ao mesmo tempo (índice único)
+        db.session.rollback()
+        CartItem.query.filter_by(user_id=current_user.id, product_id=product_id).update(
+            {CartItem.quantity: CartItem.quantity + quantity}
+        )
+        db.session.commit()
     flash(f'{product.name} adicionado ao carrinho!', 'success')
     
     return redirect(url_for('cart.view_cart'))
@@ -77,6 +89,12 @@ def remove_from_cart(item_id):
     
     return redirect(url_for('cart.view_cart'))
 
+@cart_bp.route('/remover-carrinho/produto/<int:product_id>')
+def remove_guest_item_from_cart(product_id):
+    remove_guest_item(product_id)
+    flash('Item removido do carrinho.', 'info')
+    return redirect(url_for('cart.view_cart'))
+
 @cart_bp.route('/atualizar-carrinho/<int:item_id>', methods=['POST'])
 @login_required
 def update_cart(item_id):
@@ -99,7 +117,6 @@ def update_cart(item_id):
     return jsonify({'success': True, 'message': 'Carrinho atualizado'})
 
 @cart_bp.route('/aplicar-cupom', methods=['POST'])
-@login_required
 def apply_coupon():
     coupon_code = request.form.get('coupon_code', '').strip().upper()
     
@@ -107,22 +124,9 @@ def apply_coupon():
         flash('Digite um código de cupom.', 'warning')
         return redirect(url_for('cart.view_cart'))
     
-    coupon = Coupon.query.filter_by(code=coupon_code).first()
-    
-    if not coupon:
-        flash('Cupom inválido.', 'danger')
-        return redirect(url_for('cart.view_cart'))
-    
-    is_valid, message = coupon.is_valid()
-    if not is_valid:
-        flash(message, 'danger')
-        return redirect(url_for('cart.view_cart'))
-    
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-    subtotal = sum(item.product.price * item.quantity for item in cart_items)
-    
-    if subtotal < coupon.min_purchase:
-        flash(f'Compra mínima de R$ {coupon.min_purchase:.2f} necessária para usar este cupom.', 'warning')
+    quote = _current_quote(coupon_code)
+    if quote.coupon_error:
+        flash(*quote.coupon_error)
         return redirect(url_for('cart.view_cart'))
     
     session['coupon_code'] = coupon_code
@@ -130,7 +134,6 @@ def apply_coupon():
     return redirect(url_for('cart.view_cart'))
 
 @cart_bp.route('/remover-cupom', methods=['POST'])
-@login_required
 def remove_coupon():
     session.pop('coupon_code', None)
     flash('Cupom removido.', 'info')
@@ -139,17 +142,17 @@ def remove_coupon():
 @cart_bp.route('/finalizar-compra', methods=['POST'])
 @login_required
 def checkout():
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-    
-    if not cart_items:
-        flash('Seu carrinho está vazio.', 'warning')
-        return redirect(url_for('cart.view_cart'))
-    
     delivery_type = request.form.get('delivery_type', 'delivery')
     customer_name = request.form.get('customer_name', '').strip()
     customer_phone = request.form.get('customer_phone', '').strip()
     delivery_address = request.form.get('delivery_address', '').strip()
     
+    quote = quote_cart(current_user.id, session.get('coupon_code'), delivery_type)
+    
+    if not quote:
+        flash('Seu carrinho está vazio.', 'warning')
+        return redirect(url_for('cart.view_cart'))
+    
     if not customer_name or not customer_phone:
         flash('Por favor, preencha seu nome e telefone.', 'warning')
         return redirect(url_for('cart.view_cart'))
@@ -158,71 +161,51 @@ def checkout():
         flash('Por favor, preencha o endereço de entrega.', 'warning')
         return redirect(url_for('cart.view_cart'))
     
-    subtotal = sum(item.product.price * item.quantity for item in cart_items)
-    discount = 0
-    applied_coupon = None
-    
-    coupon_code = session.get('coupon_code')
-    if coupon_code:
-        coupon = Coupon.query.filter_by(code=coupon_code).first()
-        if coupon:
-            is_valid, message = coupon.is_valid()
-            if not is_valid:
-                session.pop('coupon_code', None)
-                flash(f'Cupom não pôde ser aplicado: {message}', 'warning')
-            elif subtotal < coupon.min_purchase:
-                session.pop('coupon_code', None)
-                flash(f'Cupom não pôde ser aplicado: compra mínima de R$ {coupon.min_purchase:.2f} necessária.', 'warning')
-            else:
-                discount = coupon.calculate_discount(subtotal)
-                applied_coupon = coupon
-    
-    shipping_cost = 0
-    if delivery_type == 'delivery':
-        shipping_cost_setting = float(StoreSettings.get_setting('shipping_cost', '15'))
-        free_shipping_min = float(StoreSettings.get_setting('free_shipping_min', '300'))
-        if subtotal < free_shipping_min:
-            shipping_cost = shipping_cost_setting
-    
-    total = subtotal - discount + shipping_cost
+    if quote.coupon_error:
+        session.pop('coupon_code', None)
+        flash(f'Cupom não pôde ser aplicado: {quote.coupon_error.message}', 'warning')
     
+    for line in quote.unavailable:
+        flash(f'Produto {line.name} sem estoque suficiente.', 'danger')
+        return redirect(url_for('cart.view_cart'))
+    
+    # Daqui em diante uma única transação curta de escrita
     order = Order(
         user_id=current_user.id, 
-        total=total, 
+        total=quote.total, 
         status='Pendente',
         payment_status='Pendente',
         delivery_type=delivery_type,
         delivery_address=delivery_address if delivery_type == 'delivery' else None,
         customer_name=customer_name,
         customer_phone=customer_phone,
-        shipping_cost=shipping_cost
+        shipping_cost=quote.shipping_cost
     )
-    db.session.add(order)
-    db.session.flush()
-    
-    for cart_item in cart_items:
-        if cart_item.product.stock < cart_item.quantity:
-            flash(f'Produto {cart_item.product.name} sem estoque suficiente.', 'danger')
-            db.session.rollback()
-            return redirect(url_for('cart.view_cart'))
-        
-        order_item = OrderItem(
-            order_id=order.id,
-            product_id=cart_item.product_id,
-            quantity=cart_item.quantity,
-            price=cart_item.product.price
-        )
-        
-        cart_item.product.stock -= cart_item.quantity
-        
-        db.session.add(order_item)
-        db.session.delete(cart_item)
-    
-    if applied_coupon:
-        applied_coupon.times_used += 1
-        db.session.add(applied_coupon)
+    order.items = [
+        OrderItem(product_id=line.product_id, quantity=line.quantity, price=line.price)
+        for line in quote.lines
+    ]
+    
+    try:
+        reserve_stock(order, quote.stock_lines, current_app.config['STOCK_RESERVATION_TTL'])
+        if quote.coupon:
+            consume_coupon(quote.coupon.id)
+        db.session.add(order)
+        CartItem.query.filter(
+            CartItem.id.in_([line.id for line in quote.lines])
+        ).delete(synchronize_session=False)
+        db.session.commit()
+    except OutOfStockError as e:
+        db.session.rollback()
+        name = next((line.name for line in quote.lines if line.product_id == e.product_id), e.product_id)
+        flash(f'Produto {name} sem estoque suficiente.', 'danger')
+        return redirect(url_for('cart.view_cart'))
+    except CouponExhaustedError:
+        db.session.rollback()
+        session.pop('coupon_code', None)
+        flash('Cupom não pôde ser aplicado: Cupom atingiu o limite de uso', 'warning')
+        return redirect(url_for('cart.view_cart'))
     
-    db.session.commit()
     session.pop('coupon_code', None)
     
     flash(f'Pedido #{order.id} criado! Prossiga para o pagamento.', 'success')
@@ -231,5 +214,11 @@ def checkout():
 @cart_bp.route('/meus-pedidos')
 @login_required
 def my_orders():
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).all()
+    orders = paginate_request(
+        Order.query.options(
+            selectinload(Order.items).joinedload(OrderItem.product)
+        ).filter_by(user_id=current_user.id),
+        [desc(Order.created_at), desc(Order.id)],
+        default_per_page=10
+    )
     return render_template('orders.html', orders=orders)
@@ -1,62 +1,100 @@
-from flask import Blueprint, render_template, request
-from app.models import Product, Category, Slide
-from sqlalchemy import or_
+from flask import Blueprint, render_template, request, abort
+from sqlalchemy.orm import joinedload
+from app import db
+from app.models import Product, Review
+from app.cache import category_cache, home_page_cache
+from app.search import search_products
+from app.pagination import paginate_request, asc, desc
+from app.http_cache import conditional_page
+from app.page_cache import cache_tags
+
+REVIEWS_PER_PAGE = 10
+
+# Ordenações da listagem por categoria; cada uma tem índice próprio
+CATEGORY_SORTS = {
+    'name': [asc(Product.name), asc(Product.id)],
+    'rating': [desc(Product.rating_avg), desc(Product.id)],
+}
 
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/')
 def index():
-    categories = Category.query.all()
-    featured_products = Product.query.filter_by(featured=True, active=True).limit(12).all()
-    slides = Slide.query.filter_by(active=True).order_by(Slide.order, Slide.created_at.desc()).all()
-    
-    if not featured_products:
-        featured_products = Product.query.filter_by(active=True).limit(12).all()
+    categories = category_cache.all()
+    home = home_page_cache.get()
     
-    category_products = {}
-    for category in categories:
-        category_products[category.id] = Product.query.filter_by(
-            category_id=category.id,
-            active=True
-        ).limit(6).all()
-    
-    return render_template('index.html', categories=categories, products=featured_products, slides=slides, category_products=category_products)
+    return conditional_page(
+        lambda: render_template('index.html', categories=categories, products=home.featured, slides=home.slides, category_products=home.category_products),
+        (home_page_cache.signature(), category_cache.signature()),
+        (home_page_cache.changed_at, category_cache.changed_at)
+    )
+
+def _categories_updated_at(categories):
+    return max((c.updated_at for c in categories if c.updated_at), default=None)
+
+def _category_version(category_id):
+    # Uma agregação cobre inclusões, edições (updated_at) e exclusões (contagem)
+    return db.session.query(
+        db.func.max(Product.updated_at), db.func.count(Product.id)
+    ).filter(Product.category_id == category_id).one()
 
 @main_bp.route('/produto/<int:product_id>')
 def product_detail(product_id):
     product = Product.query.get_or_404(product_id)
-    categories = Category.query.all()
-    related_products = Product.query.filter(
-        Product.category_id == product.category_id,
-        Product.id != product.id,
-        Product.active == True
-    ).limit(4).all()
+    cache_tags(f'category:{product.category_id}')
+    categories = category_cache.all()
+    category_updated_at, category_count = _category_version(product.category_id)
     
-    return render_template('product_detail.html', product=product, categories=categories, related_products=related_products)
+    def render():
+        related_products = Product.query.filter(
+            Product.category_id == product.category_id,
+            Product.id != product.id,
+            Product.active == True
+        ).limit(4).all()
+        reviews = paginate_request(
+            Review.query.filter_by(product_id=product.id).options(joinedload(Review.user)),
+            [desc(Review.created_at), desc(Review.id)],
+            default_per_page=REVIEWS_PER_PAGE
+        )
+        return render_template('product_detail.html', product=product, categories=categories,
+                               related_products=related_products, reviews=reviews)
+    
+    return conditional_page(
+        render,
+        (product.id, product.updated_at, category_updated_at, category_count, category_cache.signature()),
+        (product.updated_at, category_updated_at, _categories_updated_at(categories))
+    )
 
 @main_bp.route('/categoria/<int:category_id>')
 def category_products(category_id):
-    category = Category.query.get_or_404(category_id)
-    categories = Category.query.all()
-    products = Product.query.filter_by(category_id=category_id, active=True).all()
+    category = category_cache.get(category_id)
+    if category is None:
+        abort(404)
+    categories = category_cache.all()
+    products_updated_at, products_count = _category_version(category_id)
+    
+    sort = request.args.get('sort', 'name')
+    if sort not in CATEGORY_SORTS:
+        sort = 'name'
     
-    return render_template('category.html', category=category, categories=categories, products=products)
+    def render():
+        products = paginate_request(
+            Product.query.filter_by(category_id=category_id, active=True),
+            CATEGORY_SORTS[sort]
+        )
+        return render_template('category.html', category=category, categories=categories, products=products, sort=sort)
+    
+    return conditional_page(
+        render,
+        (category_id, products_updated_at, products_count, category_cache.signature()),
+        (products_updated_at, _categories_updated_at(categories))
+    )
 
 @main_bp.route('/buscar')
 def search():
     query = request.args.get('q', '')
-    categories = Category.query.all()
-    
-    if query:
-        products = Product.query.filter(
-            or_(
-                Product.name.contains(query),
-                Product.description.contains(query),
-                Product.code.contains(query)
-            ),
-            Product.active == True
-        ).all()
-    else:
-        products = []
+    categories = category_cache.all()
+    
+    results = search_products(query, after=request.args.get('after'), before=request.args.get('before'))
     
-    return render_template('search.html', query=query, products=products, categories=categories)
+    return render_template('search.html', query=query, products=results.items, results=results, categories=categories)
@@ -1,18 +1,18 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
+from datetime import datetime
 from app import db
-from app.models import Order, StoreSettings
-import mercadopago
-import os
+from app.models import Order, OrderItem, StoreSettings
+from app.inventory import commit_order_reservations
+from app.sales import record_order_sale
+from app.mercadopago_client import get_mp_sdk, provider_call
+from app.payment_queue import enqueue_notification, wake_worker
+import hashlib
+import json
 
 payment_bp = Blueprint('payment', __name__)
 
-def get_mp_sdk():
-    access_token = os.getenv('MERCADOPAGO_ACCESS_TOKEN')
-    if not access_token:
-        return None
-    return mercadopago.SDK(access_token)
-
 @payment_bp.route('/criar-preferencia/<int:order_id>', methods=['GET', 'POST'])
 @login_required
 def create_preference(order_id):
@@ -22,15 +22,11 @@ def create_preference(order_id):
         flash('Acesso negado.', 'danger')
         return redirect(url_for('cart.my_orders'))
     
-    sdk = get_mp_sdk()
-    if not sdk:
-        flash('Configuração de pagamento não encontrada. Entre em contato com o suporte.', 'danger')
-        return redirect(url_for('cart.my_orders'))
-    
     base_url = request.url_root.rstrip('/')
     
     items = []
-    for item in order.items:
+    order_items = OrderItem.query.filter_by(order_id=order.id).options(joinedload(OrderItem.product)).all()
+    for item in order_items:
         items.append({
             "title": item.product.name,
             "quantity": item.quantity,
@@ -66,12 +62,32 @@ def create_preference(order_id):
         "statement_descriptor": "FERMARC ROBOTICA"
     }
     
+    # Nova tentativa do mesmo pedido: reaproveita a preferência já criada
+    # enquanto não expirar e os dados enviados forem os mesmos
+    key = hashlib.sha256(json.dumps(preference_data, sort_keys=True).encode()).hexdigest()
+    now = datetime.utcnow()
+    if (order.preference_url and order.preference_key == key
+            and order.preference_expires_at and order.preference_expires_at > now):
+        return redirect(order.preference_url)
+    
+    sdk = get_mp_sdk()
+    if not sdk:
+        flash('Configuração de pagamento não encontrada. Entre em contato com o suporte.', 'danger')
+        return redirect(url_for('cart.my_orders'))
+    
     try:
-        preference_response = sdk.preference().create(preference_data)
+        preference_response = provider_call('preference.create', sdk.preference().create, preference_data)
         preference = preference_response["response"]
         
+        order.preference_id = str(preference["id"])
+        order.preference_url = preference["init_point"]
+        order.preference_key = key
+        order.preference_expires_at = now + current_app.config['PAYMENT_PREFERENCE_TTL']
+        db.session.commit()
+        
         return redirect(preference["init_point"])
     except Exception as e:
+        db.session.rollback()
         flash(f'Erro ao criar pagamento: {str(e)}', 'danger')
         return redirect(url_for('cart.my_orders'))
 
@@ -89,6 +105,8 @@ def payment_success():
             order.payment_status = 'Aprovado'
             order.payment_id = payment_id
             order.status = 'Confirmado'
+            commit_order_reservations(order.id)
+            record_order_sale(order.id)
             db.session.commit()
     
     return render_template('payment_success.html', payment_id=payment_id, order=order)
@@ -127,44 +145,24 @@ def payment_pending():
 
 @payment_bp.route('/webhook', methods=['POST'])
 def webhook():
-    data = request.get_json()
-    
-    if not data:
+    # Só registra a notificação e responde; a consulta ao Mercado Pago e a
+    # atualização do pedido ficam com o worker da fila (app/payment_queue.py)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    resource = data.get('data')
+    if not isinstance(resource, dict):
+        resource = {}
+    
+    topic = request.args.get('topic') or request.args.get('type') or data.get('type') or data.get('topic')
+    resource_id = request.args.get('id') or request.args.get('data.id') or resource.get('id')
+    
+    if not topic or not resource_id:
         return jsonify({'error': 'No data'}), 400
     
-    topic = request.args.get('topic') or request.args.get('type')
-    
     if topic == 'payment':
-        payment_id = request.args.get('id') or request.args.get('data.id')
-        
-        sdk = get_mp_sdk()
-        if not sdk:
-            return jsonify({'error': 'SDK not configured'}), 500
-        
-        try:
-            payment_info = sdk.payment().get(payment_id)
-            payment = payment_info["response"]
-            
-            external_reference = payment.get('external_reference')
-            if external_reference:
-                order = Order.query.get(int(external_reference))
-                if order:
-                    order.payment_id = str(payment['id'])
-                    
-                    if payment['status'] == 'approved':
-                        order.payment_status = 'Aprovado'
-                        order.status = 'Confirmado'
-                    elif payment['status'] == 'pending':
-                        order.payment_status = 'Pendente'
-                    elif payment['status'] == 'rejected':
-                        order.payment_status = 'Rejeitado'
-                    elif payment['status'] == 'refunded':
-                        order.payment_status = 'Reembolsado'
-                        order.status = 'Cancelado'
-                    
-                    db.session.commit()
-        except Exception as e:
-            print(f"Webhook error: {str(e)}")
-            return jsonify({'error': str(e)}), 500
+        enqueue_notification(topic, str(resource_id))
+        db.session.commit()
+        wake_worker(current_app)
     
     return jsonify({'status': 'ok'}), 200
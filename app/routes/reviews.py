@@ -1,7 +1,9 @@
 from flask import Blueprint, request, render_template, redirect, url_for, flash
 from flask_login import login_required, current_user
+from sqlalchemy.exc import IntegrityError
 from app import db
 from app.models import Review, Product, Order, OrderItem
+from app.ratings import apply_review_change
 
 reviews_bp = Blueprint('reviews', __name__, url_prefix='/reviews')
 
@@ -41,7 +43,13 @@ def add_review(product_id):
         )
         
         db.session.add(review)
-        db.session.commit()
+        apply_review_change(product, new_rating=rating)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash('Você já avaliou este produto!', 'info')
+            return redirect(url_for('main.product_detail', product_id=product_id))
         
         flash('Avaliação enviada com sucesso!', 'success')
         return redirect(url_for('main.product_detail', product_id=product_id))
@@ -65,6 +73,7 @@ def edit_review(review_id):
             flash('Avaliação deve ser entre 1 e 5 estrelas!', 'danger')
             return redirect(url_for('reviews.edit_review', review_id=review_id))
         
+        apply_review_change(review.product, old_rating=review.rating, new_rating=rating)
         review.rating = rating
         review.comment = comment
         db.session.commit()
@@ -84,6 +93,7 @@ def delete_review(review_id):
         return redirect(url_for('main.index'))
     
     product_id = review.product_id
+    apply_review_change(review.product, old_rating=review.rating)
     db.session.delete(review)
     db.session.commit()
     
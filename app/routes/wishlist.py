@@ -1,14 +1,19 @@
 from flask import Blueprint, jsonify, request, render_template, redirect, url_for, flash
 from flask_login import login_required, current_user
+from sqlalchemy.exc import IntegrityError
 from app import db
 from app.models import Wishlist, Product
+from app.wishlists import wishlist_product_ids, wishlist_changed, parse_ids
+from sqlalchemy.orm import joinedload
 
 wishlist_bp = Blueprint('wishlist', __name__, url_prefix='/wishlist')
 
 @wishlist_bp.route('/')
 @login_required
 def view_wishlist():
-    wishlists = Wishlist.query.filter_by(user_id=current_user.id).all()
+    wishlists = Wishlist.query.filter_by(user_id=current_user.id).options(
+        joinedload(Wishlist.product)
+    ).order_by(Wishlist.created_at.desc(), Wishlist.id.desc()).all()
     return render_template('wishlist.html', wishlists=wishlists)
 
 @wishlist_bp.route('/add/<int:product_id>', methods=['POST'])
@@ -16,18 +21,18 @@ def view_wishlist():
 def add_to_wishlist(product_id):
     product = Product.query.get_or_404(product_id)
     
-    existing = Wishlist.query.filter_by(
-        user_id=current_user.id,
-        product_id=product_id
-    ).first()
-    
-    if existing:
+    if product_id in wishlist_product_ids():
         flash('Produto já está na sua lista de desejos!', 'info')
     else:
         wishlist_item = Wishlist(user_id=current_user.id, product_id=product_id)
         db.session.add(wishlist_item)
-        db.session.commit()
-        flash('Produto adicionado à lista de desejos!', 'success')
+        try:
+            db.session.commit()
+            flash('Produto adicionado à lista de desejos!', 'success')
+        except IntegrityError:
+            db.session.rollback()
+            flash('Produto já está na sua lista de desejos!', 'info')
+        wishlist_changed()
     
     return redirect(request.referrer or url_for('main.index'))
 
@@ -42,16 +47,30 @@ def remove_from_wishlist(wishlist_id):
     
     db.session.delete(wishlist_item)
     db.session.commit()
+    wishlist_changed()
     flash('Produto removido da lista de desejos!', 'success')
     
     return redirect(url_for('wishlist.view_wishlist'))
 
+@wishlist_bp.route('/remove/produto/<int:product_id>', methods=['POST'])
+@login_required
+def remove_product_from_wishlist(product_id):
+    Wishlist.query.filter_by(user_id=current_user.id, product_id=product_id).delete()
+    db.session.commit()
+    wishlist_changed()
+    flash('Produto removido da lista de desejos!', 'success')
+    
+    return redirect(request.referrer or url_for('wishlist.view_wishlist'))
+
 @wishlist_bp.route('/check/<int:product_id>')
 @login_required
 def check_in_wishlist(product_id):
-    exists = Wishlist.query.filter_by(
-        user_id=current_user.id,
-        product_id=product_id
-    ).first() is not None
-    
-    return jsonify({'in_wishlist': exists})
+    return jsonify({'in_wishlist': product_id in wishlist_product_ids()})
+
+@wishlist_bp.route('/check')
+@login_required
+def check_many_in_wishlist():
+    # ?ids=1,2,3 -> {"in_wishlist": {"1": true, "2": false, ...}}
+    product_ids = wishlist_product_ids()
+    ids = parse_ids(request.args.get('ids'))
+    return jsonify({'in_wishlist': {str(product_id): product_id in product_ids for product_id in ids}})
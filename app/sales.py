@@ -0,0 +1,158 @@
+from datetime import datetime
+from flask.cli import AppGroup
+from sqlalchemy import select, update, delete, func, and_
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models import Order, OrderItem, DailySales, ProductDailySales
+import click
+
+# Pedidos que contam como venda; 'Cancelado' (ou a volta para 'Pendente') desfaz
+SOLD_STATUSES = ('Confirmado', 'Enviado', 'Entregue')
+
+_UPSERT_DIALECTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def _add(table, keys, values, sign):
+    # Soma (ou subtrai) values na linha de keys, criando a linha se preciso
+    row = {**keys, **{name: value * sign for name, value in values.items()}}
+    dialect = db.engine.dialect.name
+    if dialect in _UPSERT_DIALECTS:
+        stmt = _UPSERT_DIALECTS[dialect](table).values(row)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[name] for name in keys],
+            set_={name: table.c[name] + stmt.excluded[name] for name in values},
+        )
+        db.session.execute(stmt)
+        return
+    where = and_(*(table.c[name] == value for name, value in keys.items()))
+    result = db.session.execute(
+        update(table).where(where).values({name: table.c[name] + row[name] for name in values})
+    )
+    if result.rowcount == 0:
+        db.session.execute(table.insert().values(row))
+
+
+def _apply(order_id, day, sign):
+    orders = Order.__table__
+    items = OrderItem.__table__
+    total = db.session.execute(select(orders.c.total).where(orders.c.id == order_id)).scalar() or 0
+    lines = db.session.execute(
+        select(items.c.product_id, func.sum(items.c.quantity), func.sum(items.c.quantity * items.c.price))
+        .where(items.c.order_id == order_id)
+        .group_by(items.c.product_id)
+    ).all()
+    _add(DailySales.__table__, {'day': day}, {
+        'orders': 1,
+        'items': sum(quantity for _, quantity, _ in lines),
+        'revenue': total,
+    }, sign)
+    for product_id, quantity, revenue in lines:
+        _add(ProductDailySales.__table__, {'day': day, 'product_id': product_id}, {
+            'quantity': quantity,
+            'revenue': revenue,
+        }, sign)
+
+
+def record_order_sale(order_id, now=None):
+    # Idempotente: o UPDATE condicional garante uma única contagem por pedido,
+    # mesmo com webhook e retorno do pagamento chegando juntos
+    now = now or datetime.utcnow()
+    table = Order.__table__
+    result = db.session.execute(
+        update(table)
+        .where(table.c.id == order_id)
+        .where(table.c.confirmed_at.is_(None))
+        .values(confirmed_at=now)
+    )
+    if result.rowcount != 1:
+        return False
+    _apply(order_id, now.date(), 1)
+    return True
+
+
+def revert_order_sale(order_id):
+    table = Order.__table__
+    confirmed_at = db.session.execute(select(table.c.confirmed_at).where(table.c.id == order_id)).scalar()
+    if confirmed_at is None:
+        return False
+    result = db.session.execute(
+        update(table)
+        .where(table.c.id == order_id)
+        .where(table.c.confirmed_at == confirmed_at)
+        .values(confirmed_at=None)
+    )
+    if result.rowcount != 1:
+        return False
+    _apply(order_id, confirmed_at.date(), -1)
+    return True
+
+
+def sync_order_sale(order_id, status):
+    # Chamado na mesma transação que muda o status do pedido
+    if status in SOLD_STATUSES:
+        return record_order_sale(order_id)
+    return revert_order_sale(order_id)
+
+
+def rebuild_sales(conn):
+    # Recalcula tudo a partir de order.confirmed_at
+    orders = Order.__table__
+    items = OrderItem.__table__
+    conn.execute(delete(ProductDailySales.__table__))
+    conn.execute(delete(DailySales.__table__))
+
+    day = func.date(orders.c.confirmed_at)
+    order_items = (
+        select(items.c.order_id, func.sum(items.c.quantity).label('quantity'))
+        .group_by(items.c.order_id)
+        .subquery()
+    )
+    conn.execute(DailySales.__table__.insert().from_select(
+        ['day', 'orders', 'items', 'revenue'],
+        select(day, func.count(orders.c.id), func.coalesce(func.sum(order_items.c.quantity), 0), func.sum(orders.c.total))
+        .select_from(orders.outerjoin(order_items, order_items.c.order_id == orders.c.id))
+        .where(orders.c.confirmed_at.is_not(None))
+        .group_by(day)
+    ))
+    conn.execute(ProductDailySales.__table__.insert().from_select(
+        ['day', 'product_id', 'quantity', 'revenue'],
+        select(day, items.c.product_id, func.sum(items.c.quantity), func.sum(items.c.quantity * items.c.price))
+        .select_from(items.join(orders, orders.c.id == items.c.order_id))
+        .where(orders.c.confirmed_at.is_not(None))
+        .group_by(day, items.c.product_id)
+    ))
+
+
+def best_sellers_query(limit=5):
+    # Agrega o acumulado por produto primeiro; só os top N buscam o nome
+    from app.models import Product
+    table = ProductDailySales.__table__
+    sold = func.sum(table.c.quantity)
+    top = (
+        select(table.c.product_id, sold.label('total_sold'))
+        .group_by(table.c.product_id)
+        .order_by(sold.desc())
+        .limit(limit)
+        .subquery()
+    )
+    return db.session.query(Product.name, top.c.total_sold).join(
+        top, top.c.product_id == Product.id
+    ).order_by(top.c.total_sold.desc())
+
+
+def best_sellers(limit=5):
+    return best_sellers_query(limit).all()
+
+
+sales_cli = AppGroup('sales', help='Estatísticas de vendas diárias do painel.')
+
+
+@sales_cli.command('rebuild')
+def rebuild_command():
+    with db.engine.begin() as conn:
+        rebuild_sales(conn)
+        days = conn.execute(select(func.count()).select_from(DailySales.__table__)).scalar()
+    click.echo(f'Estatísticas recalculadas: {days} dia(s) com vendas.')
@@ -0,0 +1,136 @@
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import text, or_, Integer, Float
+from app.pagination import paginate_keyset, asc
+import click
+import re
+
+SEARCH_PAGE_SIZE = 24
+
+# Peso de cada coluna no BM25: nome, código, descrição
+BM25_WEIGHTS = (10.0, 5.0, 1.0)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_FTS_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+        name, code, description,
+        content='product', content_rowid='id',
+        tokenize="unicode61 remove_diacritics 2",
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(rowid, name, code, description)
+        VALUES (new.id, new.name, new.code, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, code, description)
+        VALUES ('delete', old.id, old.name, old.code, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name, code, description ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, code, description)
+        VALUES ('delete', old.id, old.name, old.code, old.description);
+        INSERT INTO product_fts(rowid, name, code, description)
+        VALUES (new.id, new.name, new.code, new.description);
+    END
+    """,
+]
+
+
+def fts_enabled():
+    from app import db
+    return db.engine.dialect.name == 'sqlite'
+
+
+def create_search_schema(conn):
+    for statement in _FTS_SCHEMA:
+        conn.execute(text(statement))
+
+
+def init_search(app):
+    from app import db
+    if not fts_enabled():
+        return
+    with db.engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_fts'")
+        ).first()
+        create_search_schema(conn)
+        if not exists:
+            conn.execute(text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
+
+
+def rebuild_index():
+    from app import db
+    with db.engine.begin() as conn:
+        conn.execute(text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
+        conn.execute(text("INSERT INTO product_fts(product_fts) VALUES ('optimize')"))
+
+
+def build_match_query(query):
+    # Cada termo vira uma busca por prefixo entre aspas; os termos são combinados com AND
+    tokens = _TOKEN_RE.findall(query or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_query(query):
+    # Devolve (consulta, chaves de ordenação) ou None quando não há termos
+    from app.models import Product
+    match = build_match_query(query)
+    if not match:
+        return None
+
+    if fts_enabled():
+        ranked = text(
+            "SELECT rowid AS id, bm25(product_fts, :w_name, :w_code, :w_description) AS score "
+            "FROM product_fts WHERE product_fts MATCH :match"
+        ).bindparams(
+            match=match,
+            w_name=BM25_WEIGHTS[0],
+            w_code=BM25_WEIGHTS[1],
+            w_description=BM25_WEIGHTS[2],
+        ).columns(id=Integer, score=Float).subquery('ranked')
+        results = Product.query.join(ranked, ranked.c.id == Product.id).filter(
+            Product.active == True
+        )
+        keys = [asc(ranked.c.score), asc(Product.id)]
+    else:
+        results = Product.query.filter(
+            or_(
+                Product.name.contains(query),
+                Product.description.contains(query),
+                Product.code.contains(query)
+            ),
+            Product.active == True
+        )
+        keys = [asc(Product.name), asc(Product.id)]
+    return results, keys
+
+
+def search_products(query, after=None, before=None, per_page=SEARCH_PAGE_SIZE):
+    from app.models import Product
+    search = search_query(query)
+    if search is None:
+        return paginate_keyset(Product.query.filter(False), [asc(Product.id)], per_page=per_page)
+    results, keys = search
+    return paginate_keyset(results, keys, per_page=per_page, after=after, before=before, with_total=True)
+
+
+search_cli = AppGroup('search', help='Índice de busca de produtos (FTS5).')
+
+
+@search_cli.command('rebuild')
+def rebuild_command():
+    if not fts_enabled():
+        click.echo('Busca FTS5 disponível apenas com SQLite.')
+        return
+    init_search(current_app)
+    rebuild_index()
+    click.echo('Índice de busca reconstruído.')
@@ -0,0 +1,101 @@
+from flask import session
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models import CartItem, Product
+
+# Carrinho de visitante: {product_id: quantidade} no cookie de sessão assinado.
+# Nada é gravado no banco até o login.
+SESSION_KEY = 'guest_cart'
+MAX_LINES = 50
+
+_UPSERT_DIALECTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def guest_items():
+    raw = session.get(SESSION_KEY) or {}
+    items = {}
+    for product_id, quantity in raw.items():
+        try:
+            product_id, quantity = int(product_id), int(quantity)
+        except (TypeError, ValueError):
+            continue
+        if quantity > 0:
+            items[product_id] = quantity
+    return items
+
+
+def _save(items):
+    # Chaves string: o cookie de sessão é serializado em JSON
+    if items:
+        session[SESSION_KEY] = {str(product_id): quantity for product_id, quantity in items.items()}
+    else:
+        session.pop(SESSION_KEY, None)
+
+
+def add_guest_item(product_id, quantity):
+    items = guest_items()
+    if product_id not in items and len(items) >= MAX_LINES:
+        return False
+    items[product_id] = items.get(product_id, 0) + quantity
+    _save(items)
+    return True
+
+
+def set_guest_items(items):
+    _save(items)
+
+
+def remove_guest_item(product_id):
+    items = guest_items()
+    items.pop(product_id, None)
+    _save(items)
+
+
+def clear_guest_cart():
+    session.pop(SESSION_KEY, None)
+
+
+def merge_guest_cart(user_id):
+    # Um único INSERT ... ON CONFLICT soma as quantidades às linhas que o
+    # usuário já tinha (índice único user_id + product_id)
+    items = guest_items()
+    if not items:
+        return 0
+    existing_products = set(
+        db.session.execute(db.select(Product.id).where(Product.id.in_(items))).scalars()
+    )
+    rows = [
+        {'user_id': user_id, 'product_id': product_id, 'quantity': quantity}
+        for product_id, quantity in items.items()
+        if product_id in existing_products
+    ]
+    if not rows:
+        clear_guest_cart()
+        return 0
+    table = CartItem.__table__
+    dialect = db.engine.dialect.name
+    if dialect in _UPSERT_DIALECTS:
+        stmt = _UPSERT_DIALECTS[dialect](table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.product_id],
+            set_={'quantity': table.c.quantity + stmt.excluded.quantity},
+        )
+        db.session.execute(stmt, rows)
+    else:
+        existing = {
+            item.product_id: item
+            for item in CartItem.query.filter(
+                CartItem.user_id == user_id, CartItem.product_id.in_(items)
+            )
+        }
+        for row in rows:
+            if row['product_id'] in existing:
+                existing[row['product_id']].quantity += row['quantity']
+            else:
+                db.session.add(CartItem(**row))
+    db.session.commit()
+    clear_guest_cart()
+    return len(rows)
@@ -0,0 +1,100 @@
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+from flask import g, has_request_context
+from sqlalchemy import select
+from app import db
+from app.cache import SnapshotCache
+import logging
+
+logger = logging.getLogger(__name__)
+
+SettingSpec = namedtuple('SettingSpec', ['key', 'kind', 'default'])
+
+SETTINGS = (
+    SettingSpec('pickup_enabled', 'bool', True),
+    SettingSpec('pickup_address', 'str', ''),
+    SettingSpec('delivery_enabled', 'bool', True),
+    SettingSpec('free_shipping_min', 'money', Decimal('300')),
+    SettingSpec('shipping_cost', 'money', Decimal('15')),
+)
+
+SETTINGS_BY_KEY = {spec.key: spec for spec in SETTINGS}
+
+StoreConfig = namedtuple('StoreConfig', [spec.key for spec in SETTINGS] + ['version'])
+
+
+def parse_value(spec, raw):
+    if raw is None:
+        return spec.default
+    if spec.kind == 'bool':
+        return str(raw).strip().lower() in ('true', '1', 'on', 'yes', 'sim')
+    if spec.kind == 'money':
+        try:
+            value = Decimal(str(raw).strip().replace(',', '.'))
+        except InvalidOperation:
+            raise ValueError(f'Valor inválido para {spec.key}: {raw!r}')
+        if not value.is_finite() or value < 0:
+            raise ValueError(f'Valor inválido para {spec.key}: {raw!r}')
+        return value.quantize(Decimal('0.01'))
+    return str(raw)
+
+
+def serialize_value(spec, value):
+    if spec.kind == 'bool':
+        return 'true' if value else 'false'
+    if spec.kind == 'money':
+        return str(parse_value(spec, value))
+    return '' if value is None else str(value)
+
+
+class SettingsCache(SnapshotCache):
+    # O snapshot guarda a versão lida do banco junto com os valores; get()
+    # confere a versão atual (uma consulta por requisição) antes de usá-lo,
+    # então uma gravação feita em outro worker vale na próxima requisição
+    def _build(self):
+        from app.models import StoreSettings
+        rows = dict(
+            StoreSettings.query.with_entities(StoreSettings.setting_key, StoreSettings.setting_value).all()
+        )
+        values = {}
+        for spec in SETTINGS:
+            try:
+                values[spec.key] = parse_value(spec, rows.get(spec.key))
+            except ValueError as e:
+                logger.warning('%s; usando padrão %r', e, spec.default)
+                values[spec.key] = spec.default
+        return StoreConfig(version=rows.get(StoreSettings.VERSION_KEY) or '', **values)
+
+    def _stored_version(self):
+        if has_request_context() and 'store_settings_version' in g:
+            return g.store_settings_version
+        from app.models import StoreSettings
+        version = db.session.execute(
+            select(StoreSettings.setting_value).where(StoreSettings.setting_key == StoreSettings.VERSION_KEY)
+        ).scalar() or ''
+        if has_request_context():
+            g.store_settings_version = version
+        return version
+
+    def get(self):
+        version = self._stored_version()
+        value = self.get_value()
+        if value.version != version:
+            with self._lock:
+                if self._value is value:
+                    self._value = None
+            value = self.get_value()
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+        if has_request_context():
+            g.pop('store_settings_version', None)
+
+
+settings_cache = SettingsCache()
+
+
+def get_store_settings():
+    return settings_cache.get()
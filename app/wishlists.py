@@ -0,0 +1,99 @@
+from collections import OrderedDict
+from flask import session
+from flask_login import current_user
+from sqlalchemy import select
+from app import db
+from app.models import Wishlist
+import threading
+import time
+
+# Conjunto de product_ids favoritados por usuário, em LRU por processo.
+# A chave inclui uma versão guardada na sessão do usuário: quando ele muda a
+# lista em um worker, os outros workers deixam de casar a entrada antiga.
+SESSION_VERSION_KEY = 'wishlist_version'
+MAX_USERS = 2048
+TTL = 300
+
+# Limite de ids aceitos por chamada do endpoint em lote
+MAX_BATCH_IDS = 200
+
+
+class WishlistSetCache:
+    def __init__(self, max_users=MAX_USERS, ttl=TTL):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] == version and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[2]
+        self.misses += 1
+        product_ids = frozenset(db.session.execute(
+            select(Wishlist.product_id).where(Wishlist.user_id == user_id)
+        ).scalars())
+        with self._lock:
+            self._entries[user_id] = (version, time.monotonic(), product_ids)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return product_ids
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            'users': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / requests, 4) if requests else None,
+        }
+
+
+wishlist_cache = WishlistSetCache()
+
+
+def wishlist_product_ids():
+    if not current_user.is_authenticated:
+        return frozenset()
+    return wishlist_cache.get(current_user.id, session.get(SESSION_VERSION_KEY, 0))
+
+
+def wishlist_changed():
+    # Chamado por add/remove depois do commit
+    session[SESSION_VERSION_KEY] = session.get(SESSION_VERSION_KEY, 0) + 1
+    wishlist_cache.invalidate(current_user.id)
+
+
+def parse_ids(raw):
+    ids = []
+    for value in (raw or '').split(','):
+        value = value.strip()
+        if value.isdigit():
+            ids.append(int(value))
+        if len(ids) >= MAX_BATCH_IDS:
+            break
+    return ids
+
+
+def init_wishlists(app):
+    @app.context_processor
+    def inject_wishlist():
+        # Carregado só se o template perguntar (e uma vez por requisição)
+        loaded = []
+
+        def in_wishlist(product_id):
+            if not loaded:
+                loaded.append(wishlist_product_ids())
+            return product_id in loaded[0]
+
+        return dict(in_wishlist=in_wishlist)